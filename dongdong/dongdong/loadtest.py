@@ -0,0 +1,230 @@
+"""
+In-process load generator for `manage.py loadtest`.
+
+Virtual users run in threads, each with its own test Client, and send a weighted mix of requests through the
+full middleware stack and the real URLconf. Every request is timed on the client side.
+"""
+
+import random
+import secrets
+import threading
+import time
+from collections import defaultdict
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import Client
+
+from groups.models import Group, Membership
+from users.helpers import synthetic_phone_numbers
+from users.models import User
+
+PASSWORD = "loadtest-password"
+
+# Share of requests per operation in the peak-hour mix.
+DEFAULT_MIX = {"login": 5, "groups": 40, "expense": 30, "calculate": 25}
+
+# Named mixes for --preset. In a login storm most requests hash a password, and the question is how far the
+# p99 of the cheap endpoints moves while they do.
+PRESETS = {
+    "peak": DEFAULT_MIX,
+    "login-storm": {"login": 60, "groups": 25, "expense": 5, "calculate": 10},
+}
+
+# Statuses of requests turned away by backpressure rather than failed.
+REJECTED_STATUSES = {429, 503}
+
+
+def parse_mix(value):
+    """Parse "login=5,groups=40" into {"login": 5, "groups": 40}."""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name!r}; choose from {', '.join(OPERATIONS)}.")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def seed(rng, users, groups, members):
+    """
+    Create `users` users sharing one password and `groups` groups of `members` members each.
+
+    The password is hashed once for everyone, so seeding does not pay the hasher per user. Names and phone
+    numbers come from a per-run nonce rather than `rng`, so a rerun with the same --seed against the same
+    database does not collide with the users of the last run; `rng` only picks the members of each group.
+    Returns {group_id: [member ids]} and a list of (user_id, phone_number).
+    """
+    nonce = secrets.randbits(24)
+    tag = f"lt{nonce:06x}"
+    password = make_password(PASSWORD)
+    created = User.objects.bulk_create(
+        [
+            User(
+                username=f"{tag}_{i}",
+                phone_number=phone_number,
+                email=f"{tag}_{i}@loadtest.local",
+                password=password,
+            )
+            for i, phone_number in enumerate(synthetic_phone_numbers(users, nonce))
+        ]
+    )
+
+    group_members = {}
+    for i in range(groups):
+        people = rng.sample(created, min(members, len(created)))
+        group = Group.objects.create(name=f"{tag}_{i}", owner=people[0], description="loadtest")
+        Membership.objects.bulk_create(
+            [
+                Membership(
+                    user=user, group=group, role=Membership.Role.OWNER if user == people[0] else Membership.Role.MEMBER
+                )
+                for user in people
+            ]
+        )
+        group_members[group.id] = [user.id for user in people]
+
+    return group_members, [(user.id, user.phone_number) for user in created]
+
+
+class VirtualUser:
+    def __init__(self, rng, client, user_id, phone_number, group_ids, group_members):
+        self.rng = rng
+        self.client = client
+        self.user_id = user_id
+        self.phone_number = phone_number
+        self.group_ids = group_ids
+        self.group_members = group_members
+        self.token = None
+
+    def headers(self):
+        return {"HTTP_AUTHORIZATION": f"Bearer {self.token}"}
+
+    def login(self):
+        response = self.client.post(
+            "/users/login/",
+            # Phone numbers are stored as 989XXXXXXXXX; the login form takes the local 09XXXXXXXXX spelling.
+            {"phone_number": "0" + self.phone_number[2:], "password": PASSWORD},
+            content_type="application/json",
+        )
+        if response.status_code == 200:
+            self.token = response.json()["access"]
+        return response
+
+    def groups(self):
+        return self.client.get("/groups/group/", **self.headers())
+
+    def expense(self):
+        group_id = self.rng.choice(self.group_ids)
+        members = self.group_members[group_id]
+        shares = self.rng.sample(members, min(len(members), self.rng.randint(2, 4)))
+        data = {
+            "name": "loadtest",
+            "description": "loadtest",
+            "group": group_id,
+            "split": "equal",
+            "amount": f"{self.rng.randint(100, 100000) / 100:.2f}",
+            "shares": [{"user": user_id} for user_id in shares],
+        }
+        return self.client.post("/expenses/expense/", data, content_type="application/json", **self.headers())
+
+    def calculate(self):
+        return self.client.get(f"/expenses/calculate/{self.rng.choice(self.group_ids)}/", **self.headers())
+
+
+OPERATIONS = {
+    "login": VirtualUser.login,
+    "groups": VirtualUser.groups,
+    "expense": VirtualUser.expense,
+    "calculate": VirtualUser.calculate,
+}
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def summarize(samples, elapsed):
+    """
+    Per-operation count, error count, throughput and p50/p95/p99 latency in milliseconds.
+
+    Requests rejected by backpressure (429/503) are counted separately from errors, and throughput only counts
+    the ones that were served.
+    """
+    by_operation = defaultdict(list)
+    errors = defaultdict(int)
+    rejected = defaultdict(int)
+    for operation, seconds, status in samples:
+        by_operation[operation].append(seconds)
+        if status in REJECTED_STATUSES:
+            rejected[operation] += 1
+        elif status >= 400:
+            errors[operation] += 1
+
+    rows = []
+    for operation, timings in sorted(by_operation.items()):
+        timings.sort()
+        rows.append(
+            {
+                "operation": operation,
+                "requests": len(timings),
+                "errors": errors[operation],
+                "rejected": rejected[operation],
+                "rps": round((len(timings) - rejected[operation]) / elapsed, 1),
+                "p50_ms": round(percentile(timings, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(timings, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(timings, 0.99) * 1000, 2),
+            }
+        )
+    return rows
+
+
+def run(mix, concurrency, duration, accounts, group_members, seed_value=0):
+    """
+    Drive `concurrency` virtual users for `duration` seconds and return (samples, elapsed seconds).
+
+    Each sample is (operation, seconds, status code); a request that raised counts as status 599.
+    """
+    operations = list(mix)
+    weights = [mix[operation] for operation in operations]
+    group_ids = list(group_members)
+    samples = []
+    lock = threading.Lock()
+    start = threading.Barrier(concurrency + 1)
+
+    def virtual_user(index):
+        rng = random.Random(seed_value * 1000003 + index)
+        user_id, phone_number = accounts[index % len(accounts)]
+        member_of = [group_id for group_id in group_ids if user_id in group_members[group_id]] or group_ids
+        user = VirtualUser(rng, Client(raise_request_exception=False), user_id, phone_number, member_of, group_members)
+        while user.login().status_code in REJECTED_STATUSES:
+            # Every later request needs the token, so wait out backpressure on the first login.
+            time.sleep(0.1)
+        local = []
+        start.wait()
+        deadline = time.perf_counter() + duration
+        try:
+            while time.perf_counter() < deadline:
+                operation = rng.choices(operations, weights)[0]
+                started = time.perf_counter()
+                try:
+                    status = OPERATIONS[operation](user).status_code
+                except Exception:
+                    status = 599
+                local.append((operation, time.perf_counter() - started, status))
+        finally:
+            connection.close()
+            with lock:
+                samples.extend(local)
+
+    threads = [threading.Thread(target=virtual_user, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - began
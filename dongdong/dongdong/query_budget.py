@@ -0,0 +1,98 @@
+"""
+Per-view query budgets and N+1 detection.
+
+A view declares `query_budget = 3` (any method) or `query_budget = {"GET": 3, "POST": 6}`. QueryBudgetMiddleware
+counts the queries of every request and logs a warning when a view goes over its budget, or when one SQL shape
+repeats QUERY_BUDGET_REPEAT_THRESHOLD times or more, which is what a query in a loop looks like.
+QueryBudgetMixin applies the same checks inside tests.
+"""
+
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_LIST = re.compile(r"%s(?:\s*,\s*%s)+")
+
+
+def sql_shape(sql):
+    """The statement with IN (...) and VALUES lists of any length collapsed, so batches of any size match."""
+    return PLACEHOLDER_LIST.sub("%s, ...", sql)
+
+
+def budget_for(view_class, method):
+    budget = getattr(view_class, "query_budget", None)
+    if isinstance(budget, dict):
+        return budget.get(method)
+    return budget
+
+
+class QueryRecorder:
+    """connection.execute_wrapper() callable counting the queries it sees, grouped by SQL shape."""
+
+    def __init__(self):
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.shapes[sql_shape(sql)] += 1
+        return execute(sql, params, many, context)
+
+    @property
+    def count(self):
+        return sum(self.shapes.values())
+
+    def problems(self, budget=None, repeat_threshold=None):
+        if repeat_threshold is None:
+            repeat_threshold = settings.QUERY_BUDGET_REPEAT_THRESHOLD
+
+        problems = []
+        if budget is not None and self.count > budget:
+            problems.append(f"{self.count} queries, budget is {budget}")
+        for shape, count in self.shapes.most_common():
+            if count < repeat_threshold:
+                break
+            problems.append(f"{count}x {shape}")
+        return problems
+
+
+class QueryBudgetMiddleware:
+    """Counts the queries of each request; enable with QUERY_BUDGET_ENABLED=True."""
+
+    def __init__(self, get_response):
+        if not settings.QUERY_BUDGET_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        budget = budget_for(getattr(match.func, "view_class", None), request.method) if match else None
+        problems = recorder.problems(budget)
+        if problems:
+            logger.warning("%s %s: %s", request.method, request.path, "; ".join(problems))
+
+        response["X-Query-Count"] = str(recorder.count)
+        return response
+
+
+class QueryBudgetMixin:
+    """TestCase mixin: `with self.assertQueryBudget(GroupView, "GET"): self.client.get(...)`."""
+
+    @contextmanager
+    def assertQueryBudget(self, view_class, method="GET"):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            yield recorder
+
+        problems = recorder.problems(budget_for(view_class, method))
+        if problems:
+            self.fail(f"{view_class.__name__} {method} is over its query budget:\n" + "\n".join(problems))
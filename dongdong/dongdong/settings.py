@@ -54,10 +54,12 @@ INSTALLED_APPS = [
     "users.apps.UsersConfig",
     "groups.apps.GroupsConfig",
     "expenses.apps.ExpensesConfig",
+    "jobs.apps.JobsConfig",
 ]
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
+    "dongdong.query_budget.QueryBudgetMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -139,6 +141,10 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+# Uploaded imports and finished exports of background jobs are kept in the default storage, under jobs/. With the
+# file system storage, MEDIA_ROOT must be shared by the web processes and `manage.py run_jobs`.
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", os.path.join(BASE_DIR, "media"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -149,15 +155,125 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "users.authentication.JWTAuthentication",
-    ]
+    ],
+    "DEFAULT_THROTTLE_CLASSES": [
+        "dongdong.throttling.TokenBucketThrottle",
+    ],
+    # Anonymous requests are throttled per client address. NUM_PROXIES is the number of reverse proxies in front
+    # of Django that append to X-Forwarded-For (1 behind the bundled nginx); the address is read that many entries
+    # from the end of the header. With the default 0 the header is ignored and REMOTE_ADDR is used: a client can
+    # put anything in X-Forwarded-For, so trusting it without a proxy would give every request a fresh bucket.
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", 0)),
 }
 
+# Rate limiting
+
+# Token bucket per user (per client IP when anonymous): up to BURST tokens, refilled at RATE tokens per
+# second. A request costs its view's `throttle_cost`, 1 by default. The anonymous bucket is shared by everyone
+# behind the same address (an office or carrier NAT), so it is sized for a crowd: logins and registrations cost
+# 10, which lets one address start 20 at once and then one every two seconds.
+THROTTLE_ENABLED = os.getenv("THROTTLE_ENABLED", "True").lower() == "true"
+THROTTLE_USER_RATE = float(os.getenv("THROTTLE_USER_RATE", 5))
+THROTTLE_USER_BURST = int(os.getenv("THROTTLE_USER_BURST", 100))
+THROTTLE_ANON_RATE = float(os.getenv("THROTTLE_ANON_RATE", 5))
+THROTTLE_ANON_BURST = int(os.getenv("THROTTLE_ANON_BURST", 200))
+
+# Each worker takes up to THROTTLE_LEASE_SIZE tokens from Redis at once and spends them locally for at most
+# THROTTLE_LEASE_TTL seconds; THROTTLE_MAX_KEYS bounds the buckets and leases a worker keeps track of.
+THROTTLE_LEASE_SIZE = int(os.getenv("THROTTLE_LEASE_SIZE", 5))
+THROTTLE_LEASE_TTL = float(os.getenv("THROTTLE_LEASE_TTL", 1))
+THROTTLE_MAX_KEYS = int(os.getenv("THROTTLE_MAX_KEYS", 10000))
+
+# Keyset pagination of list endpoints (opt-in with ?page_size= or ?cursor=)
+
+PAGINATION_PAGE_SIZE = int(os.getenv("PAGINATION_PAGE_SIZE", 50))
+PAGINATION_MAX_PAGE_SIZE = int(os.getenv("PAGINATION_MAX_PAGE_SIZE", 500))
+
+# Background jobs settings
+
+# Processes `manage.py run_jobs` keeps busy, and how often it polls the queue when idle.
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", 2))
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", 1.0))
+
+# Running jobs send a heartbeat at least after every chunk of work; one silent for this many seconds is assumed
+# lost and handed out again, up to JOBS_MAX_ATTEMPTS attempts in all. Imports resume after their last chunk.
+JOBS_STALE_AFTER = int(os.getenv("JOBS_STALE_AFTER", 60 * 10))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", 3))
+
+# Job durations reported by the stats endpoint cover the jobs finished within this many seconds.
+JOBS_STATS_WINDOW = int(os.getenv("JOBS_STATS_WINDOW", 60 * 60))
+
+# Query budgets
+
+# Count the queries of every request, warn when a view exceeds its `query_budget` or one SQL shape repeats
+# this many times (an N+1), and send the count back in an X-Query-Count header.
+QUERY_BUDGET_ENABLED = os.getenv("QUERY_BUDGET_ENABLED", "False").lower() == "true"
+QUERY_BUDGET_REPEAT_THRESHOLD = int(os.getenv("QUERY_BUDGET_REPEAT_THRESHOLD", 5))
+
+# Password hashing
+
+# Threads per process hashing passwords for login and registration, and how many more hashes may wait for
+# one. Logins beyond that get a 503 with Retry-After, as do ones left waiting PASSWORD_HASHING_TIMEOUT seconds.
+PASSWORD_HASHING_WORKERS = int(os.getenv("PASSWORD_HASHING_WORKERS", 2))
+PASSWORD_HASHING_QUEUE = int(os.getenv("PASSWORD_HASHING_QUEUE", 8))
+PASSWORD_HASHING_TIMEOUT = float(os.getenv("PASSWORD_HASHING_TIMEOUT", 10))
+PASSWORD_HASHING_RETRY_AFTER = int(os.getenv("PASSWORD_HASHING_RETRY_AFTER", 1))
+
+# Contact lookup
+
+# Phone numbers one lookup request may check, and how long a number with no user is remembered as such.
+# Registering clears the remembered miss, so this only bounds repeated misses, not new users.
+USERS_LOOKUP_MAX_NUMBERS = int(os.getenv("USERS_LOOKUP_MAX_NUMBERS", 500))
+USERS_LOOKUP_MISS_TTL = int(os.getenv("USERS_LOOKUP_MISS_TTL", 60))
+
 # JWT settings
 
 JWT_SECRET_KEY = os.getenv("SECRET_KEY")
 JWT_ALGORITHM = "HS256"
 JWT_ACCESS_TOKEN_LIFETIME = datetime.timedelta(minutes=15)
 JWT_REFRESH_TOKEN_LIFETIME = datetime.timedelta(days=7)
+# Tokens are allowlisted by jti. Tokens issued before that were stored whole and are honoured until they expire;
+# turn this off (and run purge_legacy_tokens) once they have all aged out.
+JWT_ACCEPT_LEGACY_TOKENS = os.getenv("JWT_ACCEPT_LEGACY_TOKENS", "True").lower() == "true"
+
+# Each worker keeps up to JWT_USER_CACHE_SIZE verified access tokens with their user for at most
+# JWT_USER_CACHE_TTL seconds. Logouts reach the other workers within JWT_REVOCATION_SYNC_INTERVAL seconds;
+# a worker idle for longer than JWT_REVOCATION_TTL drops its whole cache instead.
+JWT_USER_CACHE_SIZE = int(os.getenv("JWT_USER_CACHE_SIZE", 10000))
+JWT_USER_CACHE_TTL = int(os.getenv("JWT_USER_CACHE_TTL", 60))
+JWT_REVOCATION_SYNC_INTERVAL = float(os.getenv("JWT_REVOCATION_SYNC_INTERVAL", 5))
+JWT_REVOCATION_TTL = int(os.getenv("JWT_REVOCATION_TTL", 60 * 10))
+
+# Stateless mode skips the allowlist lookup: a valid signature and exp are enough unless the jti was revoked.
+# Revoked jtis are kept in a per-worker bloom filter, so the cache is only asked on a filter hit.
+JWT_STATELESS = os.getenv("JWT_STATELESS", "False").lower() == "true"
+JWT_REVOKED_FILTER_CAPACITY = int(os.getenv("JWT_REVOKED_FILTER_CAPACITY", 100000))
+JWT_REVOKED_FILTER_ERROR_RATE = float(os.getenv("JWT_REVOKED_FILTER_ERROR_RATE", 0.001))
+
+# Expenses settings
+
+# How CalculateView computes balances: "ledger" (persisted per-member rows),
+# "aggregate" (GROUP BY over shares) or "replay" (walk every expense in Python).
+EXPENSES_BALANCE_MODE = os.getenv("EXPENSES_BALANCE_MODE", "ledger")
+
+# Budget of the exact (minimum-transfer) settlement solver before it falls back to the greedy one.
+SETTLEMENT_EXACT_MAX_PARTICIPANTS = int(os.getenv("SETTLEMENT_EXACT_MAX_PARTICIPANTS", 16))
+SETTLEMENT_EXACT_TIME_BUDGET = float(os.getenv("SETTLEMENT_EXACT_TIME_BUDGET", 0.25))
+
+# Settlement plans are cached per (group, version), so the timeout only bounds how long unused plans linger.
+SETTLEMENT_CACHE_TIMEOUT = int(os.getenv("SETTLEMENT_CACHE_TIMEOUT", 60 * 60 * 24))
+
+# A user's cross-group summary is keyed by the versions and names of their groups, like settlement plans, so the
+# timeout only bounds how long unused summaries linger.
+NET_POSITION_CACHE_TIMEOUT = int(os.getenv("NET_POSITION_CACHE_TIMEOUT", 60 * 10))
+
+# Bulk import writes the expenses of this many input rows per transaction (and an async import sends a heartbeat
+# with each) and reports at most this many row errors.
+EXPENSES_IMPORT_CHUNK_SIZE = int(os.getenv("EXPENSES_IMPORT_CHUNK_SIZE", 500))
+EXPENSES_IMPORT_MAX_ERRORS = int(os.getenv("EXPENSES_IMPORT_MAX_ERRORS", 100))
+
+# Rows fetched per round trip from the server-side cursor of the streaming export.
+EXPENSES_EXPORT_CHUNK_SIZE = int(os.getenv("EXPENSES_EXPORT_CHUNK_SIZE", 2000))
 
 CACHES = {
     "default": {
@@ -0,0 +1,41 @@
+"""
+Settings for `manage.py loadtest`: the real apps and URLconf with local stand-ins for Postgres and Redis.
+
+    python manage.py loadtest --settings=dongdong.settings_loadtest
+
+The database is a SQLite file next to manage.py unless LOADTEST_DATABASE=postgres, which keeps the
+DATABASES of settings.py (point it at a local Postgres). The cache is always in-process memory.
+"""
+
+import os
+
+from dongdong.settings import *  # noqa: F401,F403
+from dongdong.settings import BASE_DIR, DATABASES, JWT_SECRET_KEY, SECRET_KEY
+
+LOADTEST = True
+
+# Every virtual user logs in from the same address; the load test measures the app, not the rate limiter.
+THROTTLE_ENABLED = False
+
+DEBUG = False
+ALLOWED_HOSTS = ["testserver", "localhost", "127.0.0.1"]
+
+SECRET_KEY = SECRET_KEY or "loadtest-secret-key"
+JWT_SECRET_KEY = JWT_SECRET_KEY or SECRET_KEY
+
+if os.getenv("LOADTEST_DATABASE", "sqlite") != "postgres":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.getenv("LOADTEST_SQLITE_PATH", BASE_DIR / "loadtest.sqlite3"),
+            # Wait for the write lock instead of failing when virtual users write concurrently.
+            "OPTIONS": {"timeout": 30},
+        }
+    }
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "OPTIONS": {"MAX_ENTRIES": 100000},
+    }
+}
@@ -0,0 +1,169 @@
+"""
+Token-bucket rate limiting for DRF views.
+
+Every user, or client IP for anonymous requests, has a bucket of THROTTLE_*_BURST tokens refilled at
+THROTTLE_*_RATE tokens per second. A request costs its view's `throttle_cost` (1 unless the view declares
+`throttle_cost = 10` or `throttle_cost = {"POST": 10}`), so expensive endpoints drain a bucket faster than
+cheap ones.
+
+Buckets live in Redis and are updated by a Lua script, so every worker draws from the same bucket atomically.
+To avoid a Redis round trip per request, a worker takes a lease of up to THROTTLE_LEASE_SIZE tokens at once and
+spends it locally for at most THROTTLE_LEASE_TTL seconds; tokens still unspent by then lapse, which only makes
+the limit slightly stricter. A refusal is remembered locally until its Retry-After passes, so a client that
+keeps retrying does not cost a round trip each time either. Without a Redis connection the buckets are kept
+per process.
+"""
+
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1]: bucket. ARGV: refill rate, burst, cost of this request, tokens wanted (cost plus lease).
+# Returns {tokens granted, seconds to wait}; nothing is granted unless the bucket holds `cost` tokens.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local wanted = tonumber(ARGV[4])
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+
+local granted = 0
+local wait = 0
+if tokens >= cost then
+    granted = math.min(wanted, math.floor(tokens))
+    tokens = tokens - granted
+else
+    wait = (cost - tokens) / rate
+end
+
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil(burst / rate) + 1)
+return {granted, tostring(wait)}
+"""
+
+
+def throttle_cost(view, method):
+    cost = getattr(view, "throttle_cost", 1)
+    if isinstance(cost, dict):
+        return cost.get(method, 1)
+    return cost
+
+
+class TokenBuckets:
+    def __init__(self, lease_size, lease_ttl, max_keys):
+        self.lease_size = lease_size
+        self.lease_ttl = lease_ttl
+        self.max_keys = max_keys
+        self.leases = {}
+        self.local_buckets = {}
+        self.lock = threading.Lock()
+        self.script = None
+
+    def take(self, key, cost, rate, burst):
+        """Spend `cost` tokens of `key`'s bucket; return 0 when they were there, else the seconds to wait."""
+        now = time.monotonic()
+        with self.lock:
+            lease = self.leases.get(key)
+            if lease is not None and lease[1] > now:
+                tokens, expires_at, refused_cost = lease
+                if tokens >= cost:
+                    lease[0] -= cost
+                    return 0
+                if refused_cost is not None and cost >= refused_cost:
+                    # Refused moments ago for no more than this costs; no need to ask Redis again yet.
+                    return expires_at - now
+
+        try:
+            granted, wait = self.acquire(key, cost, max(cost, self.lease_size), rate, burst)
+        except RedisError:
+            # A rate limiter that takes the API down with it does more harm than the requests it lets through.
+            logger.warning("Rate limiting skipped, Redis is unavailable", exc_info=True)
+            return 0
+        with self.lock:
+            if len(self.leases) >= self.max_keys:
+                self.leases = {held: entry for held, entry in self.leases.items() if entry[1] > now}
+            if granted:
+                self.leases[key] = [granted - cost, now + self.lease_ttl, None]
+            else:
+                self.leases[key] = [0, now + wait, cost]
+        return 0 if granted else wait
+
+    def acquire(self, key, cost, wanted, rate, burst):
+        """Take up to `wanted` tokens (at least `cost`) from the shared bucket; return (granted, wait)."""
+        try:
+            redis = get_redis_connection("default")
+        except NotImplementedError:
+            return self.acquire_local(key, cost, rate, burst)
+
+        if self.script is None:
+            self.script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+        granted, wait = self.script(keys=[cache.make_key(key)], args=[rate, burst, cost, wanted], client=redis)
+        return int(granted), float(wait)
+
+    def acquire_local(self, key, cost, rate, burst):
+        """The Lua script's arithmetic on a per-process bucket, without leasing."""
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.local_buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < cost:
+                self.local_buckets[key] = (tokens, now)
+                return 0, (cost - tokens) / rate
+            if len(self.local_buckets) >= self.max_keys:
+                self.local_buckets.clear()
+            self.local_buckets[key] = (tokens - cost, now)
+        return cost, 0.0
+
+    def clear(self):
+        with self.lock:
+            self.leases.clear()
+            self.local_buckets.clear()
+
+
+buckets = TokenBuckets(
+    lease_size=settings.THROTTLE_LEASE_SIZE,
+    lease_ttl=settings.THROTTLE_LEASE_TTL,
+    max_keys=settings.THROTTLE_MAX_KEYS,
+)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Per-user (per-IP when anonymous) token bucket; rejected requests get a 429 with Retry-After."""
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        if not settings.THROTTLE_ENABLED:
+            return True
+
+        if request.user and request.user.is_authenticated:
+            key = f"throttle:user:{request.user.pk}"
+            rate, burst = settings.THROTTLE_USER_RATE, settings.THROTTLE_USER_BURST
+        else:
+            key = f"throttle:ip:{self.get_ident(request)}"
+            rate, burst = settings.THROTTLE_ANON_RATE, settings.THROTTLE_ANON_BURST
+
+        # A request costing more than the bucket holds could never pass.
+        cost = min(throttle_cost(view, request.method), burst)
+        wait = buckets.take(key, cost, rate, burst)
+        if wait:
+            self.wait_seconds = math.ceil(wait)
+            return False
+        return True
+
+    def wait(self):
+        return self.wait_seconds
@@ -25,5 +25,6 @@ urlpatterns = [
     path("users/", include("users.urls")),
     path("groups/", include("groups.urls")),
     path("expenses/", include("expenses.urls")),
+    path("jobs/", include("jobs.urls")),
     path("health-check/", HealthCheckView.as_view(), name="health-check"),
 ]
@@ -0,0 +1,118 @@
+import statistics
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from expenses.models import Expense, ExpenseShare
+from groups.models import Group, Membership
+from users.helpers import synthetic_phone_numbers
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    """Raised at the end of a benchmark to roll back the synthetic data it created."""
+
+
+def uniform_expense(rng, users):
+    return rng.choice(users), lambda: Decimal(rng.randint(1, 100000)) / 100
+
+
+def many_small_expense(rng, users):
+    """Coffee-sized amounts, paid by anyone."""
+    return rng.choice(users), lambda: Decimal(rng.randint(50, 1500)) / 100
+
+
+def few_payers_expense(rng, users):
+    """Three members pay for everything; the rest only owe, so most balances share a sign."""
+    return rng.choice(users[:3]), lambda: Decimal(rng.randint(1, 100000)) / 100
+
+
+def long_tail_expense(rng, users):
+    """Payers and amounts follow a power law: a few large creditors and many small debts."""
+    payer = users[min(int(rng.paretovariate(1.2)) - 1, len(users) - 1)]
+    return payer, lambda: Decimal(min(int(rng.paretovariate(1.5) * 100), 10000000)) / 100
+
+
+SHAPES = {
+    "uniform": uniform_expense,
+    "many_small": many_small_expense,
+    "few_payers": few_payers_expense,
+    "long_tail": long_tail_expense,
+}
+
+
+def create_synthetic_group(rng, members, shares, shares_per_expense, shape="uniform"):
+    """
+    Create a group of `members` users with about `shares` random shares, `shares_per_expense` per expense.
+
+    `shape` picks the payer and share amounts of every expense from SHAPES.
+    """
+    bits = rng.getrandbits(32)
+    tag = f"bench{bits:08x}"
+
+    users = User.objects.bulk_create(
+        [
+            User(username=f"{tag}_{i}", phone_number=phone_number, email=f"{tag}_{i}@bench.local")
+            for i, phone_number in enumerate(synthetic_phone_numbers(members, bits))
+        ]
+    )
+    group = Group.objects.create(name=tag, owner=users[0], description="benchmark")
+    Membership.objects.bulk_create([Membership(user=user, group=group) for user in users])
+
+    per_expense = min(shares_per_expense, len(users))
+    expense_count = max(shares // per_expense, 1)
+    pick = SHAPES[shape]
+    for offset in range(0, expense_count, 1000):
+        batch = [pick(rng, users) for _ in range(min(1000, expense_count - offset))]
+        shares = [[(user, amount()) for user in rng.sample(users, per_expense)] for _, amount in batch]
+        expenses = Expense.objects.bulk_create(
+            [
+                Expense(
+                    name=f"{tag}_{offset + i}",
+                    paid_by=payer,
+                    group=group,
+                    total=sum((share_amount for _, share_amount in expense_shares), Decimal(0)),
+                )
+                for i, ((payer, _), expense_shares) in enumerate(zip(batch, shares))
+            ]
+        )
+        ExpenseShare.objects.bulk_create(
+            [
+                ExpenseShare(expense=expense, user=user, share_amount=share_amount)
+                for expense, expense_shares in zip(expenses, shares)
+                for user, share_amount in expense_shares
+            ],
+            batch_size=5000,
+        )
+
+    return group
+
+
+def measure(function, repeat):
+    """
+    Call `function` `repeat` times and return its last result with the timings of the runs.
+
+    Peak memory comes from tracemalloc and the query count from the last run.
+    """
+    timings = []
+    peak = 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            result = function()
+            timings.append(time.perf_counter() - started)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return result, {
+        "best_ms": round(min(timings) * 1000, 3),
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "peak_kib": round(peak / 1024, 1),
+        "queries": len(queries),
+    }
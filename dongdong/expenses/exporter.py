@@ -0,0 +1,69 @@
+import csv
+import json
+
+from django.conf import settings
+
+from expenses.importer import CSV_COLUMNS
+from expenses.models import Expense
+
+EXPORT_COLUMNS = CSV_COLUMNS + ["created_at"]
+
+
+class Echo:
+    """File-like object whose write() hands the line back, so csv.writer can feed a streaming response."""
+
+    def write(self, value):
+        return value
+
+
+def expense_rows(group_id):
+    """Yield one tuple per share (or per expense without shares) from a server-side cursor."""
+    rows = (
+        Expense.objects.filter(group_id=group_id)
+        .order_by("id", "shares__id")
+        .values_list(
+            "id",
+            "name",
+            "description",
+            "paid_by_id",
+            "shares__user_id",
+            "shares__share_amount",
+            "created_at",
+        )
+    )
+    return rows.iterator(chunk_size=settings.EXPENSES_EXPORT_CHUNK_SIZE)
+
+
+def export_csv(group_id):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for expense_id, name, description, paid_by, user, share_amount, created_at in expense_rows(group_id):
+        yield writer.writerow([expense_id, name, description, paid_by, user, share_amount, created_at.isoformat()])
+
+
+def export_ndjson(group_id):
+    """Yield one JSON line per expense; its shares arrive on consecutive rows because rows are ordered by id."""
+    expense = None
+    for expense_id, name, description, paid_by, user, share_amount, created_at in expense_rows(group_id):
+        if expense is None or expense["id"] != expense_id:
+            if expense is not None:
+                yield json.dumps(expense) + "\n"
+            expense = {
+                "id": expense_id,
+                "name": name,
+                "description": description,
+                "paid_by": paid_by,
+                "created_at": created_at.isoformat(),
+                "shares": [],
+            }
+        if user is not None:
+            expense["shares"].append({"user": user, "share_amount": str(share_amount)})
+
+    if expense is not None:
+        yield json.dumps(expense) + "\n"
+
+
+EXPORTERS = {
+    "csv": (export_csv, "text/csv"),
+    "ndjson": (export_ndjson, "application/x-ndjson"),
+}
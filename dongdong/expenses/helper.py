@@ -1,7 +1,41 @@
+import hashlib
+import math
+import time
 from collections import defaultdict
 from decimal import Decimal
+from fractions import Fraction
 
-from expenses.models import Expense
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Max, Q, Sum, Value, When
+
+from expenses.models import BalanceCheckpoint, Expense, ExpenseShare, GroupBalance, Payment
+from groups.models import Group, Membership
+
+
+def is_group_member(user, group_id):
+    return Membership.objects.filter(group_id=group_id, user=user).exists()
+
+
+def filter_expenses(expenses, filters):
+    """Apply validated ExpenseFilterSerializer data to an Expense queryset."""
+    if "paid_by" in filters:
+        expenses = expenses.filter(paid_by_id=filters["paid_by"])
+    if "participant" in filters:
+        expenses = expenses.filter(shares__user_id=filters["participant"])
+    if "created_after" in filters:
+        expenses = expenses.filter(created_at__gte=filters["created_after"])
+    if "created_before" in filters:
+        expenses = expenses.filter(created_at__lt=filters["created_before"])
+    if "search" in filters:
+        expenses = expenses.filter(Q(name__icontains=filters["search"]) | Q(description__icontains=filters["search"]))
+
+    if "min_amount" in filters:
+        expenses = expenses.filter(total__gte=filters["min_amount"])
+    if "max_amount" in filters:
+        expenses = expenses.filter(total__lte=filters["max_amount"])
+
+    return expenses
 
 
 def calculate_balances(pk):
@@ -17,9 +51,315 @@ def calculate_balances(pk):
             balances[share.user_id] -= share.share_amount
         balances[total_paid_by] += total_amount
 
+    for payer_id, payee_id, amount in Payment.objects.filter(group_id=pk).values_list("payer_id", "payee_id", "amount"):
+        balances[payer_id] += amount
+        balances[payee_id] -= amount
+
     return balances
 
 
+def aggregate_balances(pk, after_expense_id=None, upto_expense_id=None, after_payment_id=None, upto_payment_id=None):
+    """
+    Sum the group's shares and payments in the database: one GROUP BY per debtor, payer, sender and recipient.
+
+    `after_expense_id` and `upto_expense_id` restrict the sums to a range of expense ids, and the payment
+    arguments do the same for payment ids.
+    """
+    balances = defaultdict(Decimal)
+    shares = ExpenseShare.objects.filter(expense__group_id=pk).order_by()
+    if after_expense_id is not None:
+        shares = shares.filter(expense_id__gt=after_expense_id)
+    if upto_expense_id is not None:
+        shares = shares.filter(expense_id__lte=upto_expense_id)
+
+    for user_id, owed in shares.values_list("user_id").annotate(total=Sum("share_amount")):
+        balances[user_id] -= owed
+    for paid_by_id, paid in shares.values_list("expense__paid_by_id").annotate(total=Sum("share_amount")):
+        balances[paid_by_id] += paid
+
+    payments = Payment.objects.filter(group_id=pk).order_by()
+    if after_payment_id is not None:
+        payments = payments.filter(id__gt=after_payment_id)
+    if upto_payment_id is not None:
+        payments = payments.filter(id__lte=upto_payment_id)
+
+    for payer_id, sent in payments.values_list("payer_id").annotate(total=Sum("amount")):
+        balances[payer_id] += sent
+    for payee_id, received in payments.values_list("payee_id").annotate(total=Sum("amount")):
+        balances[payee_id] -= received
+
+    return balances
+
+
+def ledger_balances(pk):
+    """Read the persisted per-user balances of a group, one row per member with history."""
+    balances = defaultdict(Decimal)
+    for user_id, balance in GroupBalance.objects.filter(group_id=pk).values_list("user_id", "balance"):
+        balances[user_id] = balance
+    return balances
+
+
+def checkpoint_balances(pk):
+    """Balances from the group's latest checkpoint plus the expenses and payments added after it."""
+    latest = (
+        BalanceCheckpoint.objects.filter(group_id=pk)
+        .order_by("-upto_expense_id", "-upto_payment_id")
+        .values_list("upto_expense_id", "upto_payment_id")
+        .first()
+    )
+    if latest is None:
+        return aggregate_balances(pk)
+
+    upto_expense_id, upto_payment_id = latest
+    balances = aggregate_balances(pk, after_expense_id=upto_expense_id, after_payment_id=upto_payment_id)
+    checkpoint = BalanceCheckpoint.objects.filter(
+        group_id=pk, upto_expense_id=upto_expense_id, upto_payment_id=upto_payment_id
+    )
+    for user_id, balance in checkpoint.values_list("user_id", "balance"):
+        balances[user_id] += balance
+    return balances
+
+
+def create_checkpoint(pk):
+    """
+    Snapshot the group's balances as of its newest expense and payment, replacing older checkpoints.
+
+    Ids are not committed in id order, so cutting at the highest id could skip an expense still being written
+    below it. Writes hold the group lock from before their first insert, so once the checkpoint has the lock
+    every expense and payment up to the cut is committed.
+    """
+    with transaction.atomic():
+        lock_group(pk)
+        upto = Expense.objects.filter(group_id=pk).aggregate(upto=Max("id"))["upto"]
+        if upto is None:
+            return None
+        upto_payment = Payment.objects.filter(group_id=pk).aggregate(upto=Max("id"))["upto"] or 0
+
+        balances = aggregate_balances(pk, upto_expense_id=upto, upto_payment_id=upto_payment)
+        BalanceCheckpoint.objects.filter(group_id=pk).delete()
+        BalanceCheckpoint.objects.bulk_create(
+            [
+                BalanceCheckpoint(
+                    group_id=pk,
+                    user_id=user_id,
+                    balance=balance,
+                    upto_expense_id=upto,
+                    upto_payment_id=upto_payment,
+                )
+                for user_id, balance in balances.items()
+            ]
+        )
+    return upto
+
+
+def invalidate_checkpoints(group_id, expense_id=None, payment_id=None):
+    """Drop the checkpoints that already include the expense or payment being edited or deleted."""
+    checkpoints = BalanceCheckpoint.objects.filter(group_id=group_id)
+    if expense_id is not None:
+        checkpoints.filter(upto_expense_id__gte=expense_id).delete()
+    if payment_id is not None:
+        checkpoints.filter(upto_payment_id__gte=payment_id).delete()
+
+
+BALANCE_MODES = {
+    "replay": calculate_balances,
+    "aggregate": aggregate_balances,
+    "checkpoint": checkpoint_balances,
+    "ledger": ledger_balances,
+}
+
+
+def get_balances(pk, mode=None):
+    return BALANCE_MODES[mode or settings.EXPENSES_BALANCE_MODE](pk)
+
+
+def allocate_cents(total, weights):
+    """
+    Split `total` cents in proportion to `weights` with the largest-remainder method.
+
+    Every part is rounded down, then the cents left over go to the largest fractional remainders (earlier
+    entries win ties), so the parts always add up to `total` exactly.
+    """
+    weight_sum = Fraction(sum(weights))
+    quotas = [Fraction(total) * Fraction(weight) / weight_sum for weight in weights]
+    parts = [math.floor(quota) for quota in quotas]
+
+    by_remainder = sorted(range(len(parts)), key=lambda i: quotas[i] - parts[i], reverse=True)
+    for i in by_remainder[: total - sum(parts)]:
+        parts[i] += 1
+    return parts
+
+
+SPLIT_WEIGHT_FIELDS = {
+    "equal": None,
+    "all": None,
+    "percentage": "percentage",
+    "weights": "weight",
+}
+
+
+def split_shares(split, amount, shares):
+    """Expand an equal, all-members, percentage or weights split of `amount` into exact per-user shares."""
+    field = SPLIT_WEIGHT_FIELDS[split]
+    weights = [share[field] if field else 1 for share in shares]
+    cents = allocate_cents(int(amount * 100), weights)
+    return [{"user_id": share["user_id"], "share_amount": Decimal(part) / 100} for share, part in zip(shares, cents)]
+
+
+def shares_total(shares):
+    """The amount of an expense: the sum of the share_amount of its `shares` dicts."""
+    return sum((share["share_amount"] for share in shares), Decimal(0))
+
+
+def share_deltas(paid_by_id, shares, sign=1):
+    """
+    Balance change per user caused by an expense's shares.
+
+    `shares` is an iterable of (user_id, share_amount) pairs; pass sign=-1 to undo them.
+    """
+    deltas = defaultdict(Decimal)
+    for user_id, share_amount in shares:
+        deltas[user_id] -= sign * share_amount
+        deltas[paid_by_id] += sign * share_amount
+    return deltas
+
+
+def payment_deltas(payments, sign=1):
+    """
+    Balance change per user caused by payments: the payer's debt shrinks and the payee is owed less.
+
+    `payments` is an iterable of (payer_id, payee_id, amount) triples; pass sign=-1 to undo them.
+    """
+    deltas = defaultdict(Decimal)
+    for payer_id, payee_id, amount in payments:
+        deltas[payer_id] += sign * amount
+        deltas[payee_id] -= sign * amount
+    return deltas
+
+
+def lock_group(group_id):
+    """
+    Lock the group row until the transaction ends. Every write to a group's expenses, payments or ledger takes
+    this lock before touching any of them, which serializes the writes of a group with each other and with
+    create_checkpoint.
+    """
+    list(Group.objects.select_for_update().filter(pk=group_id).values_list("pk", flat=True))
+
+
+def bump_group_version(group_id):
+    """Invalidate everything cached from the group's balances: settlement plans and members' summaries."""
+    Group.objects.filter(pk=group_id).update(version=F("version") + 1)
+
+
+def settlement_cache_key(group_id, version, strategy):
+    return f"settlement:{group_id}:{version}:{strategy}"
+
+
+def net_position_groups(user):
+    """(id, version, name) of each of the user's groups, which is everything their summary is computed from."""
+    return sorted(Group.objects.filter(membership__user=user).values_list("id", "version", "name"))
+
+
+def net_position_cache_key(user_id, groups):
+    """
+    Like settlement plans, a summary is keyed by what it was computed from: a write to one of the user's groups,
+    a rename, or joining or leaving a group gives a new key, and a summary computed before that is never read.
+    """
+    digest = hashlib.blake2b(repr(groups).encode(), digest_size=16).hexdigest()
+    return f"net-position:{user_id}:{digest}"
+
+
+def net_positions(user, groups):
+    """
+    The user's net balance in each of `groups`, the net_position_groups() of the user: one aggregate over their
+    shares and one over their payments. Groups where they have no shares or payments are listed at zero.
+    """
+    balances = {group_id: Decimal(0) for group_id, _, _ in groups}
+
+    shares = ExpenseShare.objects.filter(expense__group_id__in=balances).filter(Q(user=user) | Q(expense__paid_by=user))
+    positions = (
+        shares.values_list("expense__group_id")
+        .annotate(
+            paid=Sum("share_amount", filter=Q(expense__paid_by=user), default=Decimal(0)),
+            owed=Sum("share_amount", filter=Q(user=user), default=Decimal(0)),
+        )
+        .order_by()
+    )
+    for group_id, paid, owed in positions:
+        balances[group_id] += paid - owed
+
+    payments = Payment.objects.filter(group_id__in=balances).filter(Q(payer=user) | Q(payee=user))
+    settled = (
+        payments.values_list("group_id")
+        .annotate(
+            sent=Sum("amount", filter=Q(payer=user), default=Decimal(0)),
+            received=Sum("amount", filter=Q(payee=user), default=Decimal(0)),
+        )
+        .order_by()
+    )
+    for group_id, sent, received in settled:
+        balances[group_id] += sent - received
+
+    return [{"group": group_id, "group_name": name, "balance": balances[group_id]} for group_id, _, name in groups]
+
+
+def apply_ledger_deltas(group_id, deltas):
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        bump_group_version(group_id)
+        GroupBalance.objects.bulk_create(
+            [GroupBalance(group_id=group_id, user_id=user_id) for user_id in deltas],
+            ignore_conflicts=True,
+        )
+        GroupBalance.objects.filter(group_id=group_id, user_id__in=deltas).update(
+            balance=F("balance")
+            + Case(
+                *[When(user_id=user_id, then=Value(delta)) for user_id, delta in deltas.items()],
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+
+
+def record_payments(group_id, payments):
+    """Save (payer_id, payee_id, amount) triples as payments of the group and fold them into the ledger."""
+    with transaction.atomic():
+        lock_group(group_id)
+        created = Payment.objects.bulk_create(
+            [
+                Payment(group_id=group_id, payer_id=payer_id, payee_id=payee_id, amount=amount)
+                for payer_id, payee_id, amount in payments
+            ]
+        )
+        apply_ledger_deltas(group_id, payment_deltas(payments))
+    return created
+
+
+def rebuild_ledger(pk):
+    with transaction.atomic():
+        lock_group(pk)
+        balances = calculate_balances(pk)
+        bump_group_version(pk)
+        GroupBalance.objects.filter(group_id=pk).delete()
+        GroupBalance.objects.bulk_create(
+            [GroupBalance(group_id=pk, user_id=user_id, balance=balance) for user_id, balance in balances.items()]
+        )
+
+
+def verify_ledger(pk):
+    """Compare the ledger with a full replay and return {user_id: (ledger, replay)} for every mismatch."""
+    ledger = ledger_balances(pk)
+    replay = calculate_balances(pk)
+
+    return {
+        user_id: (ledger[user_id], replay[user_id])
+        for user_id in set(ledger) | set(replay)
+        if ledger[user_id] != replay[user_id]
+    }
+
+
 def settle_debts(balances):
     import heapq
 
@@ -51,3 +391,66 @@ def settle_debts(balances):
             heapq.heappush(creditors, (credit_balance, creditor))
 
     return settlements
+
+
+def settle_debts_exact(balances, max_participants=None, time_budget=None):
+    """
+    Settle with the fewest transfers by splitting the balances into as many zero-sum subsets as possible.
+
+    A zero-sum subset of k people always settles in k - 1 transfers, so maximising the number of subsets
+    minimises the total. The search is exponential in the number of non-zero balances; groups larger than
+    `max_participants`, or searches running longer than `time_budget` seconds, fall back to settle_debts.
+    """
+    if max_participants is None:
+        max_participants = settings.SETTLEMENT_EXACT_MAX_PARTICIPANTS
+    if time_budget is None:
+        time_budget = settings.SETTLEMENT_EXACT_TIME_BUDGET
+
+    users = [user_id for user_id, balance in balances.items() if balance]
+    amounts = [int((balances[user_id] * 100).to_integral_value()) for user_id in users]
+    if len(users) > max_participants or sum(amounts) != 0:
+        return settle_debts(balances)
+
+    full = (1 << len(users)) - 1
+    totals = [0] * (full + 1)
+    subsets = [0] * (full + 1)
+    removed = [0] * (full + 1)
+    deadline = time.monotonic() + time_budget
+
+    # subsets[mask] is the largest number of zero-sum subsets the members of `mask` can be split into;
+    # removed[mask] remembers which member to drop to walk back along an optimal chain.
+    for mask in range(1, full + 1):
+        if not mask & 0x3FF and time.monotonic() > deadline:
+            return settle_debts(balances)
+
+        lowest = mask & -mask
+        totals[mask] = totals[mask ^ lowest] + amounts[lowest.bit_length() - 1]
+
+        best = -1
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            if subsets[mask ^ bit] > best:
+                best = subsets[mask ^ bit]
+                removed[mask] = bit
+            rest ^= bit
+        subsets[mask] = best + (totals[mask] == 0)
+
+    settlements = []
+    mask = previous = full
+    while mask:
+        mask ^= removed[mask]
+        if totals[mask] == 0:
+            members = previous ^ mask
+            settlements.extend(
+                settle_debts({user_id: balances[user_id] for i, user_id in enumerate(users) if members >> i & 1})
+            )
+            previous = mask
+
+    return settlements
+
+
+SETTLEMENT_STRATEGIES = {
+    "greedy": settle_debts,
+    "exact": settle_debts_exact,
+}
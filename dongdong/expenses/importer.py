@@ -0,0 +1,225 @@
+import csv
+import json
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from expenses.helper import apply_ledger_deltas, lock_group, share_deltas, shares_total
+from expenses.models import Expense, ExpenseShare
+from expenses.serializers import ExpenseImportSerializer
+from groups.models import Membership
+
+CSV_CONTENT_TYPES = {"text/csv"}
+JSONL_CONTENT_TYPES = {"application/x-ndjson", "application/jsonl", "application/json-lines"}
+CSV_COLUMNS = ["expense", "name", "description", "paid_by", "user", "share_amount"]
+
+
+class UnreadableInput(Exception):
+    """
+    The upload cannot be read past `line`. Nothing from `first_unread` on is imported: in a CSV that includes the
+    expense whose rows were still being read.
+    """
+
+    def __init__(self, line, message, first_unread=None):
+        super().__init__(message)
+        self.line = line
+        self.message = message
+        self.first_unread = line if first_unread is None else first_unread
+
+
+class DecodedLines:
+    """The lines of a UTF-8 byte stream, decoded one by one; `line_number` is that of the last line read."""
+
+    def __init__(self, stream):
+        self.lines = iter(stream.readline, b"")
+        self.line_number = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self.lines)
+        self.line_number += 1
+        try:
+            return line.decode("utf-8")
+        except UnicodeDecodeError:
+            raise UnreadableInput(self.line_number, "Line is not valid UTF-8.")
+
+
+def read_jsonl(lines):
+    """Yield (line_number, expense) for every non-blank line; `expense` is None when the line is not JSON."""
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, None
+
+
+def read_csv(lines):
+    """
+    Yield (line_number, expense) from CSV rows with CSV_COLUMNS as header.
+
+    Each row is one share; consecutive rows with the same `expense` reference make up one expense. `lines` is a
+    DecodedLines, which tells the line a CSV error was found on.
+    """
+    rows = csv.DictReader(lines)
+    expense = None
+    try:
+        for row in rows:
+            reference = row.get("expense")
+            if expense is None or reference != expense["reference"]:
+                if expense is not None:
+                    yield expense.pop("line"), expense
+                expense = {
+                    "line": rows.line_num,
+                    "reference": reference,
+                    "name": row.get("name"),
+                    "description": row.get("description") or None,
+                    "shares": [],
+                }
+                if row.get("paid_by"):
+                    expense["paid_by"] = row["paid_by"]
+            expense["shares"].append({"user": row.get("user"), "share_amount": row.get("share_amount")})
+    except csv.Error as e:
+        raise UnreadableInput(lines.line_number, f"Line is not valid CSV: {e}.", expense and expense["line"])
+    except UnreadableInput as e:
+        raise UnreadableInput(e.line, e.message, expense and expense["line"])
+
+    if expense is not None:
+        yield expense.pop("line"), expense
+
+
+def check_content_type(content_type):
+    if content_type not in CSV_CONTENT_TYPES | JSONL_CONTENT_TYPES:
+        raise ValueError(f"Unsupported content type {content_type!r}; use text/csv or application/x-ndjson.")
+
+
+def read_expenses(stream, content_type):
+    """
+    Decode `stream` incrementally and return an iterator of (line_number, expense) pairs.
+
+    The iterator raises UnreadableInput when it reaches a line that is not UTF-8, or that breaks the CSV syntax.
+    """
+    check_content_type(content_type)
+    lines = DecodedLines(stream)
+    if content_type in CSV_CONTENT_TYPES:
+        return read_csv(lines)
+    return read_jsonl(lines)
+
+
+def write_expenses(group_id, rows):
+    with transaction.atomic():
+        lock_group(group_id)
+        expenses = Expense.objects.bulk_create(
+            [
+                Expense(
+                    group_id=group_id,
+                    paid_by_id=row["paid_by"],
+                    name=row["name"],
+                    description=row.get("description"),
+                    total=shares_total(row["shares"]),
+                )
+                for row in rows
+            ]
+        )
+        ExpenseShare.objects.bulk_create(
+            [
+                ExpenseShare(expense=expense, user_id=share["user"], share_amount=share["share_amount"])
+                for expense, row in zip(expenses, rows)
+                for share in row["shares"]
+            ]
+        )
+
+        deltas = defaultdict(Decimal)
+        for row in rows:
+            shares = [(share["user"], share["share_amount"]) for share in row["shares"]]
+            for user_id, delta in share_deltas(row["paid_by"], shares).items():
+                deltas[user_id] += delta
+        apply_ledger_deltas(group_id, deltas)
+
+
+def write_chunk(group_id, rows, progress, save_progress):
+    with transaction.atomic():
+        if rows:
+            write_expenses(group_id, rows)
+        if save_progress is not None:
+            save_progress(progress)
+
+
+def import_expenses(group_id, user, expenses, progress=None, save_progress=None):
+    """
+    Validate and insert expenses chunk by chunk, each chunk of EXPENSES_IMPORT_CHUNK_SIZE input rows in its own
+    transaction.
+
+    Rows failing validation are skipped and reported; valid rows are written regardless. Input that cannot be
+    read at all stops the import: the expenses read before it are still written, and the report ends with the
+    line it stopped at (listed even past EXPENSES_IMPORT_MAX_ERRORS).
+
+    `save_progress` is called in the transaction of every chunk with the state of the import so far, also for
+    chunks whose rows all failed validation, so a job running it keeps sending heartbeats. Passing the
+    last saved state back as `progress` resumes an interrupted import: rows up to progress["line"] are already
+    written or reported, and are skipped.
+    """
+    started = time.perf_counter()
+    members = set(Membership.objects.filter(group_id=group_id).values_list("user_id", flat=True))
+    chunk_size = settings.EXPENSES_IMPORT_CHUNK_SIZE
+
+    progress = progress or {"line": 0, "created": 0, "failed": 0, "errors": []}
+    resume_after = progress["line"]
+    line = resume_after
+    created = progress["created"]
+    failed = progress["failed"]
+    errors = list(progress["errors"])
+    chunk = []
+    rows = 0
+    try:
+        for line_number, expense in expenses:
+            if line_number <= resume_after:
+                continue
+            line = line_number
+            rows += 1
+            if expense is None:
+                serializer_errors = {"non_field_errors": ["Line is not valid JSON."]}
+            else:
+                serializer = ExpenseImportSerializer(data=expense, context={"user": user, "members": members})
+                serializer_errors = None if serializer.is_valid() else serializer.errors
+            if serializer_errors is None:
+                chunk.append(serializer.validated_data)
+            else:
+                failed += 1
+                if len(errors) < settings.EXPENSES_IMPORT_MAX_ERRORS:
+                    errors.append({"line": line_number, "errors": serializer_errors})
+
+            if rows % chunk_size == 0:
+                created += len(chunk)
+                state = {"line": line, "created": created, "failed": failed, "errors": errors}
+                write_chunk(group_id, chunk, state, save_progress)
+                chunk = []
+    except UnreadableInput as e:
+        failed += 1
+        errors.append(
+            {
+                "line": e.line,
+                "errors": {"non_field_errors": [f"{e.message} Nothing from line {e.first_unread} on was imported."]},
+            }
+        )
+
+    if chunk:
+        created += len(chunk)
+        write_chunk(
+            group_id, chunk, {"line": line, "created": created, "failed": failed, "errors": errors}, save_progress
+        )
+
+    seconds = time.perf_counter() - started
+    return {
+        "created": created,
+        "failed": failed,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "expenses_per_second": round(created / seconds, 1) if seconds else None,
+    }
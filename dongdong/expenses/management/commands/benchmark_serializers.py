@@ -0,0 +1,64 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from expenses.benchmarks import Rollback, create_synthetic_group
+from expenses.models import Expense
+from expenses.serializers import ExpenseReadSerializer, expense_read_data
+from groups.models import Membership
+from groups.serializers import MembershipReadSerializer, membership_read_data
+
+
+class Command(BaseCommand):
+    help = "Compare objects per second of the ModelSerializer and fast read paths, checking their JSON is identical."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--expenses", type=int, default=5000)
+        parser.add_argument("--members", type=int, default=500)
+        parser.add_argument("--shares-per-expense", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                group = create_synthetic_group(
+                    random.Random(options["seed"]),
+                    options["members"],
+                    options["expenses"] * options["shares_per_expense"],
+                    options["shares_per_expense"],
+                )
+                expenses = Expense.objects.filter(group=group)
+                memberships = Membership.objects.filter(group=group)
+
+                self.stdout.write(f"{'listing':<12} {'serializer obj/s':>18} {'fast path obj/s':>18}")
+                self.compare(
+                    "expenses",
+                    lambda: ExpenseReadSerializer(expenses.prefetch_related("shares"), many=True).data,
+                    lambda: expense_read_data(expenses),
+                )
+                self.compare(
+                    "memberships",
+                    lambda: MembershipReadSerializer(memberships.select_related("user"), many=True).data,
+                    lambda: membership_read_data(memberships),
+                )
+                raise Rollback
+        except Rollback:
+            pass
+
+    def compare(self, name, serializer_data, fast_data):
+        renderer = JSONRenderer()
+        rates = []
+        rendered = []
+        for build in (serializer_data, fast_data):
+            started = time.perf_counter()
+            data = build()
+            elapsed = time.perf_counter() - started
+            rates.append(len(data) / elapsed)
+            rendered.append(renderer.render(data))
+
+        if rendered[0] != rendered[1]:
+            raise CommandError(f"The fast path renders different JSON for {name}.")
+        self.stdout.write(f"{name:<12} {rates[0]:>18.0f} {rates[1]:>18.0f}")
@@ -0,0 +1,51 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from expenses.helper import SETTLEMENT_STRATEGIES
+
+
+def random_balances(rng, size):
+    """Balances made of small zero-sum clusters, the shape where the greedy heap wastes transfers."""
+    balances = {}
+    user_id = 0
+    while user_id < size:
+        cluster = min(rng.randint(2, 4), size - user_id)
+        amounts = [Decimal(rng.randint(-50000, 50000)) / 100 for _ in range(cluster - 1)]
+        amounts.append(-sum(amounts))
+        for amount in amounts:
+            balances[user_id] = amount
+            user_id += 1
+    return balances
+
+
+class Command(BaseCommand):
+    help = "Compare transfer counts and solve times of the settlement strategies across group sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[4, 8, 12, 14, 16, 50, 500])
+        parser.add_argument("--samples", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+
+        header = f"{'size':>6}"
+        for strategy in SETTLEMENT_STRATEGIES:
+            header += f" {strategy + ' transfers':>18} {strategy + ' ms':>12}"
+        self.stdout.write(header)
+
+        for size in options["sizes"]:
+            samples = [random_balances(rng, size) for _ in range(options["samples"])]
+
+            line = f"{size:>6}"
+            for settle in SETTLEMENT_STRATEGIES.values():
+                transfers = 0
+                started = time.perf_counter()
+                for balances in samples:
+                    transfers += len(settle(balances))
+                elapsed = time.perf_counter() - started
+                line += f" {transfers / len(samples):>18.2f} {elapsed * 1000 / len(samples):>12.2f}"
+            self.stdout.write(line)
@@ -0,0 +1,110 @@
+import json
+import platform
+import random
+import subprocess
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from expenses.benchmarks import SHAPES, Rollback, create_synthetic_group, measure
+from expenses.helper import BALANCE_MODES, SETTLEMENT_STRATEGIES, create_checkpoint, rebuild_ledger
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every balance mode and settlement strategy on synthetic groups of several sizes and shapes, "
+        "and write the results as JSON so runs can be compared across commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000], help="Shares per group.")
+        parser.add_argument("--shapes", nargs="+", choices=list(SHAPES), default=list(SHAPES))
+        parser.add_argument("--modes", nargs="+", choices=list(BALANCE_MODES), default=list(BALANCE_MODES))
+        parser.add_argument("--members", type=int, default=50)
+        parser.add_argument("--shares-per-expense", type=int, default=5)
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--replay-limit",
+            type=int,
+            default=200000,
+            help="Skip the replay mode for groups with more shares than this; it walks every expense in Python.",
+        )
+        parser.add_argument("--output", help="Write the JSON results to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        results = []
+        for shape in options["shapes"]:
+            for size in options["sizes"]:
+                results.extend(self.run_case(shape, size, options))
+                self.stderr.write(f"{shape} {size}: done")
+
+        report = {
+            "meta": {
+                "commit": current_commit(),
+                "started_at": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "members": options["members"],
+                "shares_per_expense": options["shares_per_expense"],
+                "repeat": options["repeat"],
+                "seed": options["seed"],
+            },
+            "results": results,
+        }
+        data = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(data + "\n")
+        else:
+            self.stdout.write(data)
+
+    def run_case(self, shape, size, options):
+        case = {"shape": shape, "shares": size}
+        rows = []
+        try:
+            with transaction.atomic():
+                group = create_synthetic_group(
+                    random.Random(options["seed"]), options["members"], size, options["shares_per_expense"], shape
+                )
+                rebuild_ledger(group.id)
+                create_checkpoint(group.id)
+
+                balances = None
+                for mode in options["modes"]:
+                    if mode == "replay" and size > options["replay_limit"]:
+                        continue
+                    balances, timings = measure(lambda: BALANCE_MODES[mode](group.id), options["repeat"])
+                    rows.append({**case, "phase": "balances", "name": mode, **timings})
+                if balances is None:
+                    raise CommandError("No balance mode ran; pick at least one mode other than replay.")
+
+                for strategy, settle in SETTLEMENT_STRATEGIES.items():
+                    transfers, timings = measure(lambda: settle(balances), options["repeat"])
+                    rows.append(
+                        {
+                            **case,
+                            "phase": "settlement",
+                            "name": strategy,
+                            "debtors": sum(1 for balance in balances.values() if balance < 0),
+                            "creditors": sum(1 for balance in balances.values() if balance > 0),
+                            "transfers": len(transfers),
+                            **timings,
+                        }
+                    )
+                raise Rollback
+        except Rollback:
+            pass
+        return rows
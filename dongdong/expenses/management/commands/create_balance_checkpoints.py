@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from expenses.helper import create_checkpoint
+from groups.models import Group
+
+
+class Command(BaseCommand):
+    help = "Snapshot group balances so checkpoint-mode balance computation only replays newer expenses."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--group", type=int, action="append", dest="groups", help="Group id (repeatable).")
+        parser.add_argument(
+            "--min-expenses",
+            type=int,
+            default=1000,
+            help="Skip groups with fewer expenses than this when no --group is given.",
+        )
+
+    def handle(self, *args, **options):
+        if options["groups"]:
+            group_ids = options["groups"]
+        else:
+            group_ids = (
+                Group.objects.annotate(expense_count=Count("expense"))
+                .filter(expense_count__gte=options["min_expenses"])
+                .order_by("id")
+                .values_list("id", flat=True)
+            )
+
+        created = 0
+        for group_id in group_ids:
+            upto = create_checkpoint(group_id)
+            if upto is not None:
+                created += 1
+                self.stdout.write(f"group {group_id}: checkpoint up to expense {upto}")
+
+        self.stdout.write(self.style.SUCCESS(f"Created {created} checkpoint(s)."))
@@ -0,0 +1,96 @@
+import json
+import random
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from dongdong.loadtest import PRESETS, parse_mix, run, seed, summarize
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a weighted mix of login, group listing, expense creation and calculate requests through the "
+        "real URLconf from concurrent in-process virtual users, and report per-endpoint latency percentiles "
+        "and throughput. Run it with --settings=dongdong.settings_loadtest. Virtual users are threads, so the "
+        "numbers include GIL contention and measure the app, not a multi-process deployment."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=8, help="Virtual users sending requests at once.")
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds to send requests for.")
+        parser.add_argument(
+            "--preset",
+            choices=list(PRESETS),
+            default="peak",
+            help="Named mix: peak (the peak-hour API mix) or login-storm (mostly logins).",
+        )
+        parser.add_argument(
+            "--mix",
+            help="Relative weight of each operation, e.g. login=5,groups=40,expense=30,calculate=25; "
+            "overrides --preset.",
+        )
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--groups", type=int, default=20)
+        parser.add_argument("--members", type=int, default=8, help="Members per seeded group.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Also write the results as JSON to this file.")
+        parser.add_argument(
+            "--allow-any-settings",
+            action="store_true",
+            help="Run even without dongdong.settings_loadtest; the seeded users and groups are not removed.",
+        )
+
+    def handle(self, *args, **options):
+        if not getattr(settings, "LOADTEST", False) and not options["allow_any_settings"]:
+            raise CommandError("Run with --settings=dongdong.settings_loadtest (or pass --allow-any-settings).")
+        if options["mix"]:
+            try:
+                mix = parse_mix(options["mix"])
+            except ValueError as e:
+                raise CommandError(str(e))
+        else:
+            mix = PRESETS[options["preset"]]
+
+        call_command("migrate", verbosity=0)
+        if connection.vendor == "sqlite":
+            # WAL lets readers run while a virtual user holds the write lock.
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA journal_mode=WAL")
+
+        group_members, accounts = seed(
+            random.Random(options["seed"]), options["users"], options["groups"], options["members"]
+        )
+        # Virtual users log in as group members so every operation they send is allowed.
+        members = {user_id for people in group_members.values() for user_id in people}
+        accounts = [account for account in accounts if account[0] in members]
+        connection.close()
+
+        samples, elapsed = run(
+            mix, options["concurrency"], options["duration"], accounts, group_members, options["seed"]
+        )
+        rows = summarize(samples, elapsed)
+
+        self.stdout.write(
+            f"{'operation':<12} {'requests':>9} {'errors':>7} {'rejected':>9} {'req/s':>8} "
+            f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        )
+        for row in rows:
+            self.stdout.write(
+                f"{row['operation']:<12} {row['requests']:>9} {row['errors']:>7} {row['rejected']:>9} "
+                f"{row['rps']:>8.1f} "
+                f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}"
+            )
+        self.stdout.write(f"{len(samples)} requests in {elapsed:.1f}s ({len(samples) / elapsed:.1f} req/s)")
+
+        if options["output"]:
+            report = {
+                "concurrency": options["concurrency"],
+                "duration": round(elapsed, 3),
+                "mix": mix,
+                "database": connection.vendor,
+                "results": rows,
+            }
+            with open(options["output"], "w") as f:
+                f.write(json.dumps(report, indent=2) + "\n")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses.helper import rebuild_ledger, verify_ledger
+from groups.models import Group
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-group balance ledger from a full replay of expenses, or verify it against one."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--group", type=int, action="append", dest="groups", help="Group id (repeatable).")
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only compare the ledger with a full replay and fail if they differ.",
+        )
+
+    def handle(self, *args, **options):
+        group_ids = options["groups"] or Group.objects.order_by("id").values_list("id", flat=True)
+
+        mismatched = 0
+        for group_id in group_ids:
+            if not options["verify"]:
+                rebuild_ledger(group_id)
+
+            mismatches = verify_ledger(group_id)
+            if mismatches:
+                mismatched += 1
+                for user_id, (ledger, replay) in sorted(mismatches.items()):
+                    self.stderr.write(f"group {group_id} user {user_id}: ledger={ledger} replay={replay}")
+
+        if mismatched:
+            raise CommandError(f"{mismatched} group(s) have a ledger that does not match a full replay.")
+        self.stdout.write(self.style.SUCCESS("Ledger matches a full replay."))
@@ -0,0 +1,76 @@
+# Generated by Django 4.2 on 2026-10-18 03:52
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_ledger(apps, schema_editor):
+    ExpenseShare = apps.get_model("expenses", "ExpenseShare")
+    GroupBalance = apps.get_model("expenses", "GroupBalance")
+
+    balances = defaultdict(Decimal)
+    shares = ExpenseShare.objects.values_list("expense__group_id", "expense__paid_by_id", "user_id", "share_amount")
+    for group_id, paid_by_id, user_id, share_amount in shares.iterator():
+        balances[(group_id, user_id)] -= share_amount
+        balances[(group_id, paid_by_id)] += share_amount
+
+    GroupBalance.objects.bulk_create(
+        [
+            GroupBalance(group_id=group_id, user_id=user_id, balance=balance)
+            for (group_id, user_id), balance in balances.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("groups", "0003_group_description_alter_groupinvitation_status"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("expenses", "0002_alter_expense_description"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GroupBalance",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "balance",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "group",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="balances",
+                        to="groups.group",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("group", "user")},
+            },
+        ),
+        migrations.RunPython(build_ledger, migrations.RunPython.noop),
+    ]
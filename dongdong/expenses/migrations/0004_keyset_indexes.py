@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-18 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0003_groupbalance"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["group", "created_at", "id"], name="expense_group_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["paid_by", "created_at", "id"], name="expense_payer_created_idx"
+            ),
+        ),
+    ]
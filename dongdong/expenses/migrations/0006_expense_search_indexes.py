@@ -0,0 +1,40 @@
+# Generated by Django 4.2 on 2026-10-18 04:04
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# icontains compiles to UPPER(column::text) LIKE UPPER(%s) on PostgreSQL, so the trigram
+# indexes are built on that exact expression. Other databases (e.g. SQLite in local load
+# tests) have no GIN indexes and simply skip them.
+TRIGRAM_INDEXES = {
+    "expense_name_trgm_idx": "name",
+    "expense_description_trgm_idx": "description",
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for index, column in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {index} ON expenses_expense USING gin (UPPER({column}::text) gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for index in TRIGRAM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {index}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0005_balancecheckpoint"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2 on 2026-10-18 05:23
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    Expense = apps.get_model("expenses", "Expense")
+    ExpenseShare = apps.get_model("expenses", "ExpenseShare")
+    totals = (
+        ExpenseShare.objects.filter(expense=OuterRef("pk"))
+        .order_by()
+        .values("expense")
+        .annotate(total=Sum("share_amount"))
+        .values("total")
+    )
+    Expense.objects.update(
+        total=Coalesce(
+            Subquery(totals), Value(Decimal(0)), output_field=models.DecimalField()
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0007_payment"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="expense",
+            name="total",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["group", "total"], name="expense_group_total_idx"
+            ),
+        ),
+    ]
@@ -9,6 +9,15 @@ class Expense(models.Model):
     group = models.ForeignKey(Group, on_delete=models.CASCADE)
     description = models.CharField(max_length=511, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Sum of the shares, written together with them, so the amount filters are an index range.
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["group", "created_at", "id"], name="expense_group_created_idx"),
+            models.Index(fields=["paid_by", "created_at", "id"], name="expense_payer_created_idx"),
+            models.Index(fields=["group", "total"], name="expense_group_total_idx"),
+        ]
 
 
 class ExpenseShare(models.Model):
@@ -18,3 +27,37 @@ class ExpenseShare(models.Model):
 
     class Meta:
         unique_together = ("expense", "user")
+
+
+class Payment(models.Model):
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name="payments")
+    payer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="payments_made")
+    payee = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="payments_received")
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["group", "created_at", "id"], name="payment_group_created_idx"),
+        ]
+
+
+class GroupBalance(models.Model):
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name="balances")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ("group", "user")
+
+
+class BalanceCheckpoint(models.Model):
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name="checkpoints")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    upto_expense_id = models.BigIntegerField()
+    upto_payment_id = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("group", "upto_expense_id", "user")
@@ -1,43 +1,144 @@
+from collections import defaultdict
+from decimal import Decimal
+
 from rest_framework import serializers
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction
-from expenses.models import ExpenseShare, Expense
-from django.shortcuts import get_object_or_404
+from django.db.models import QuerySet
+from expenses.models import ExpenseShare, Expense, Payment
+from django.http import Http404
 from groups.models import Membership
+from expenses.helper import (
+    share_deltas,
+    apply_ledger_deltas,
+    invalidate_checkpoints,
+    lock_group,
+    split_shares,
+    record_payments,
+    shares_total,
+    get_balances,
+    settlement_cache_key,
+    SETTLEMENT_STRATEGIES,
+    SPLIT_WEIGHT_FIELDS,
+)
 
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 
+def check_share_members(group, shares):
+    """
+    Validate the shares and make sure every share user is in `group`, with a single IN query. Call it with the
+    group locked, so a member removed meanwhile cannot end up in the shares and the ledger.
+    """
+    for share in shares:
+        if "user_id" not in share or "share_amount" not in share:
+            raise serializers.ValidationError("Each share must include 'user' and 'share_amount'.")
+
+    users = {share["user_id"] for share in shares}
+    if len(users) != len(shares):
+        raise serializers.ValidationError("Each user can only have one share per expense.")
+    if Membership.objects.filter(group=group, user_id__in=users).count() != len(users):
+        raise serializers.ValidationError({"shares": "Every share must belong to a member of the group."})
+
+
+def build_shares(expense, shares):
+    return [
+        ExpenseShare(expense=expense, user_id=share["user_id"], share_amount=share["share_amount"]) for share in shares
+    ]
+
+
 class ExpenseShareWriteSerializer(serializers.ModelSerializer):
+    user = serializers.IntegerField(source="user_id")
+    percentage = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=0, max_value=100, required=False, write_only=True
+    )
+    weight = serializers.DecimalField(max_digits=10, decimal_places=4, min_value=0, required=False, write_only=True)
+
     class Meta:
         model = ExpenseShare
-        fields = ["id", "user", "share_amount", "expense"]
-        extra_kwargs = {"expense": {"read_only": True}, "id": {"read_only": True}}
+        fields = ["id", "user", "share_amount", "expense", "percentage", "weight"]
+        extra_kwargs = {
+            "expense": {"read_only": True},
+            "id": {"read_only": True},
+            "share_amount": {"required": False},
+        }
 
 
 class ExpenseWriteSerializer(serializers.ModelSerializer):
-    shares = ExpenseShareWriteSerializer(many=True)
+    """
+    Creates an expense paid by the requesting user.
+
+    With the default split "exact" every share carries its own share_amount, and an `amount`, if given, must be
+    their sum. Otherwise `amount` is divided on the server to the cent: "equal" between the listed users,
+    "percentage" or "weights" by each share's percentage/weight, and "all" equally between every member of the
+    group (no shares needed).
+    """
+
+    shares = ExpenseShareWriteSerializer(many=True, required=False)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False, write_only=True)
+    split = serializers.ChoiceField(choices=["exact", *SPLIT_WEIGHT_FIELDS], default="exact", write_only=True)
 
     class Meta:
         model = Expense
-        fields = ["id", "name", "group", "description", "created_at", "shares"]
+        fields = ["id", "name", "group", "description", "created_at", "shares", "amount", "split"]
         extra_kwargs = {"id": {"read_only": True}, "created_at": {"read_only": True}}
 
+    def validate(self, data):
+        split = data["split"]
+        if split == "exact":
+            shares = data.get("shares") or []
+            if "amount" in data and all("share_amount" in share for share in shares):
+                if sum(share["share_amount"] for share in shares) != data["amount"]:
+                    raise serializers.ValidationError({"amount": "The shares must add up to the amount."})
+            return data
+        if "amount" not in data:
+            raise serializers.ValidationError({"amount": f"This field is required for the '{split}' split."})
+        if split == "all":
+            return data
+
+        shares = data.get("shares")
+        if not shares:
+            raise serializers.ValidationError({"shares": f"The '{split}' split needs at least one share."})
+        field = SPLIT_WEIGHT_FIELDS[split]
+        if field and any(field not in share for share in shares):
+            raise serializers.ValidationError({"shares": f"Each share must include '{field}'."})
+        if split == "percentage" and sum(share["percentage"] for share in shares) != 100:
+            raise serializers.ValidationError({"shares": "Percentages must add up to 100."})
+        if split == "weights" and sum(share["weight"] for share in shares) <= 0:
+            raise serializers.ValidationError({"shares": "Weights must add up to more than zero."})
+        return data
+
     def create(self, validated_data):
         user = self.context["request"].user
-
+        split = validated_data.pop("split")
+        amount = validated_data.pop("amount", None)
         shares = validated_data.pop("shares", None)
-        if shares is None or len(shares) == 0:
-            raise serializers.ValidationError("share can not be empty!")
-
-        expense = Expense.objects.create(paid_by=user, **validated_data)
-        for share in shares:
-            if "user" not in share or "share_amount" not in share:
-                raise serializers.ValidationError("Each share must include 'user' and 'share_amount'.")
-            get_object_or_404(Membership, user_id=share["user"], group=expense.group)
-        for share in shares:
-            ExpenseShare.objects.create(expense=expense, **share)
+
+        if split != "all":
+            if shares is None or len(shares) == 0:
+                raise serializers.ValidationError("share can not be empty!")
+            if split != "exact":
+                shares = split_shares(split, amount, shares)
+
+        with transaction.atomic():
+            lock_group(validated_data["group"].id)
+            if split == "all":
+                members = Membership.objects.filter(group=validated_data["group"]).order_by("user_id")
+                shares = split_shares(
+                    split, amount, [{"user_id": user_id} for user_id in members.values_list("user_id", flat=True)]
+                )
+            else:
+                check_share_members(validated_data["group"], shares)
+            expense = Expense.objects.create(paid_by=user, total=shares_total(shares), **validated_data)
+            ExpenseShare.objects.bulk_create(build_shares(expense, shares))
+
+            apply_ledger_deltas(
+                expense.group_id,
+                share_deltas(expense.paid_by_id, [(share["user_id"], share["share_amount"]) for share in shares]),
+            )
         return expense
 
 
@@ -49,6 +150,61 @@ class ExpenseReadSerializer(serializers.ModelSerializer):
         fields = ["id", "name", "group", "description", "created_at", "shares", "paid_by"]
 
 
+class ExpenseFilterSerializer(serializers.Serializer):
+    paid_by = serializers.IntegerField(required=False)
+    participant = serializers.IntegerField(required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+    min_amount = serializers.DecimalField(max_digits=12, decimal_places=2, required=False)
+    max_amount = serializers.DecimalField(max_digits=12, decimal_places=2, required=False)
+    search = serializers.CharField(required=False, max_length=511)
+
+
+EXPENSE_READ_FIELDS = ["id", "name", "group_id", "description", "created_at", "paid_by_id"]
+datetime_field = serializers.DateTimeField()
+share_amount_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+def expense_read_data(expenses):
+    """
+    Fast path for ExpenseReadSerializer(expenses, many=True).data, producing the same JSON.
+
+    `expenses` is an Expense queryset, or a page of its .values(*EXPENSE_READ_FIELDS) rows. Expenses and
+    shares are fetched as plain tuples in two queries and formatted with the serializer's own fields.
+    """
+    if isinstance(expenses, QuerySet):
+        shares = ExpenseShare.objects.filter(expense__in=expenses.values("id"))
+        expenses = expenses.values(*EXPENSE_READ_FIELDS)
+    else:
+        shares = ExpenseShare.objects.filter(expense_id__in=[expense["id"] for expense in expenses])
+
+    shares_by_expense = defaultdict(list)
+    for share_id, expense_id, user_id, share_amount in shares.order_by("id").values_list(
+        "id", "expense_id", "user_id", "share_amount"
+    ):
+        shares_by_expense[expense_id].append(
+            {
+                "id": share_id,
+                "user": user_id,
+                "share_amount": share_amount_field.to_representation(share_amount),
+                "expense": expense_id,
+            }
+        )
+
+    return [
+        {
+            "id": expense["id"],
+            "name": expense["name"],
+            "group": expense["group_id"],
+            "description": expense["description"],
+            "created_at": datetime_field.to_representation(expense["created_at"]),
+            "shares": shares_by_expense[expense["id"]],
+            "paid_by": expense["paid_by_id"],
+        }
+        for expense in expenses
+    ]
+
+
 class ExpenseUpdateSerializer(serializers.ModelSerializer):
     shares = ExpenseShareWriteSerializer(many=True)
 
@@ -66,14 +222,25 @@ class ExpenseUpdateSerializer(serializers.ModelSerializer):
         shares = validated_data.pop("shares", None)
 
         with transaction.atomic():
+            lock_group(expense.group_id)
+            # Lock the expense before reading its old shares: two edits, or an edit racing a delete, would both
+            # undo the same shares otherwise.
+            if not Expense.objects.select_for_update().filter(pk=expense.pk).values_list("pk", flat=True):
+                raise Http404("No Expense matches the given query.")
             if shares is not None and len(shares) > 0:
-                for share in shares:
-                    if "user" not in share or "share_amount" not in share:
-                        raise serializers.ValidationError("Each share must include 'user' and 'share_amount'.")
-                    get_object_or_404(Membership, user_id=share["user"], group=expense.group)
-                ExpenseShare.objects.filter(expense=expense).delete()
-                for share in shares:
-                    ExpenseShare.objects.create(expense=expense, **share)
+                check_share_members(expense.group_id, shares)
+                old_shares = ExpenseShare.objects.filter(expense=expense)
+                deltas = share_deltas(expense.paid_by_id, old_shares.values_list("user_id", "share_amount"), sign=-1)
+                old_shares.delete()
+                ExpenseShare.objects.bulk_create(build_shares(expense, shares))
+                expense.total = shares_total(shares)
+
+                for user_id, delta in share_deltas(
+                    expense.paid_by_id, [(share["user_id"], share["share_amount"]) for share in shares]
+                ).items():
+                    deltas[user_id] += delta
+                apply_ledger_deltas(expense.group_id, deltas)
+                invalidate_checkpoints(expense.group_id, expense.id)
 
             for attr, value in validated_data.items():
                 setattr(expense, attr, value)
@@ -86,3 +253,101 @@ class SettlementSerializer(serializers.Serializer):
     from_user = serializers.IntegerField(source="from")
     to_user = serializers.IntegerField(source="to")
     amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+def settlement_plan(pk, version, strategy, heartbeat=None):
+    """
+    The serialized settlement plan of the group at `version`, cached until the group's balances change.
+
+    `heartbeat`, if given, is called before computing the balances and again before settling them.
+    """
+    key = settlement_cache_key(pk, version, strategy)
+    plan = cache.get(key)
+    if plan is None:
+        if heartbeat is not None:
+            heartbeat()
+        balances = get_balances(pk)
+        if heartbeat is not None:
+            heartbeat()
+        settlements = SETTLEMENT_STRATEGIES[strategy](balances)
+        plan = SettlementSerializer(settlements, many=True).data
+        cache.set(key, plan, timeout=settings.SETTLEMENT_CACHE_TIMEOUT)
+    return plan
+
+
+class PaymentWriteSerializer(serializers.ModelSerializer):
+    """
+    Records that `payer` paid `payee` back; the payer defaults to the requesting user. The requesting user must be
+    one of the two: either side may record a payment, nobody may record one between two other members.
+    """
+
+    class Meta:
+        model = Payment
+        fields = ["id", "group", "payer", "payee", "amount", "created_at"]
+        extra_kwargs = {
+            "id": {"read_only": True},
+            "created_at": {"read_only": True},
+            "payer": {"required": False},
+            "amount": {"min_value": Decimal("0.01")},
+        }
+
+    def validate(self, data):
+        user = self.context["request"].user
+        data.setdefault("payer", user)
+        if data["payer"] == data["payee"]:
+            raise serializers.ValidationError("The payer and the payee must be different users.")
+        if user not in (data["payer"], data["payee"]):
+            raise serializers.ValidationError("You can only record payments you made or received.")
+
+        users = {data["payer"].id, data["payee"].id}
+        if Membership.objects.filter(group=data["group"], user_id__in=users).count() != len(users):
+            raise serializers.ValidationError("The payer and the payee must both be members of the group.")
+        return data
+
+    def create(self, validated_data):
+        (payment,) = record_payments(
+            validated_data["group"].id,
+            [(validated_data["payer"].id, validated_data["payee"].id, validated_data["amount"])],
+        )
+        return payment
+
+
+class PaymentReadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Payment
+        fields = ["id", "group", "payer", "payee", "amount", "created_at"]
+
+
+class ExpenseImportShareSerializer(serializers.Serializer):
+    user = serializers.IntegerField()
+    share_amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+class ExpenseImportSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=31)
+    description = serializers.CharField(max_length=511, required=False, allow_null=True, allow_blank=True)
+    paid_by = serializers.IntegerField(required=False)
+    shares = ExpenseImportShareSerializer(many=True, allow_empty=False)
+
+    def validate(self, data):
+        members = self.context["members"]
+        data.setdefault("paid_by", self.context["user"].id)
+
+        users = [share["user"] for share in data["shares"]]
+        if len(set(users)) != len(users):
+            raise serializers.ValidationError("Each user can only have one share per expense.")
+        outsiders = {data["paid_by"], *users} - members
+        if outsiders:
+            raise serializers.ValidationError(f"Users {sorted(outsiders)} are not members of this group.")
+        return data
+
+
+class NetPositionSerializer(serializers.Serializer):
+    group = serializers.IntegerField()
+    group_name = serializers.CharField()
+    balance = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class NetPositionSummarySerializer(serializers.Serializer):
+    total = serializers.DecimalField(max_digits=12, decimal_places=2)
+    groups = NetPositionSerializer(many=True)
@@ -0,0 +1,44 @@
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+
+from expenses.exporter import EXPORTERS
+from expenses.importer import read_expenses, import_expenses
+from expenses.serializers import settlement_plan
+from groups.models import Group
+
+
+def calculate_job(job):
+    group_id = job.payload["group"]
+    version = Group.objects.filter(pk=group_id).values_list("version", flat=True).first()
+    return settlement_plan(group_id, version, job.payload["strategy"], heartbeat=job.heartbeat), None
+
+
+def export_job(job):
+    group_id, output = job.payload["group"], job.payload["output"]
+    exporter, content_type = EXPORTERS[output]
+    filename = f"group-{group_id}-expenses.{output}"
+
+    # Spooled to a temporary file and then saved to storage, so no export is ever held in memory whole.
+    with tempfile.TemporaryFile() as spool:
+        for count, line in enumerate(exporter(group_id), start=1):
+            spool.write(line.encode("utf-8"))
+            if count % settings.EXPENSES_EXPORT_CHUNK_SIZE == 0:
+                job.heartbeat()
+        job.output_file.save(filename, File(spool), save=False)
+    return {"content_type": content_type, "filename": filename}, job.output_file.name
+
+
+def import_job(job):
+    with job.input_file.open("rb") as stream:
+        expenses = read_expenses(stream, job.payload["content_type"])
+        # A retried import carries on after the last chunk an earlier attempt committed.
+        report = import_expenses(
+            job.payload["group"],
+            job.owner,
+            expenses,
+            progress=job.progress,
+            save_progress=lambda progress: job.heartbeat(progress=progress),
+        )
+        return report, None
@@ -1,3 +1,622 @@
-from django.test import TestCase
+import io
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from dongdong.throttling import buckets
+from expenses.benchmarks import SHAPES, create_synthetic_group
+from expenses.helper import (
+    BALANCE_MODES,
+    SETTLEMENT_STRATEGIES,
+    allocate_cents,
+    calculate_balances,
+    checkpoint_balances,
+    create_checkpoint,
+    lock_group,
+    rebuild_ledger,
+    settle_debts,
+    settle_debts_exact,
+    verify_ledger,
+)
+from expenses.models import Expense, ExpenseShare, Payment
+from expenses.serializers import EXPENSE_READ_FIELDS, ExpenseReadSerializer, expense_read_data
+from groups.models import Group, Membership
+from users.models import User
+
+
+class ExpenseWriteQueryCountTests(TestCase):
+    def setUp(self):
+        self.users = User.objects.bulk_create(
+            [User(username=f"user_{i}", phone_number=f"989{i:09d}", email=f"user_{i}@example.com") for i in range(40)]
+        )
+        self.group = Group.objects.create(name="dinner", owner=self.users[0], description="friday dinner")
+        Membership.objects.bulk_create([Membership(user=user, group=self.group) for user in self.users])
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def shares(self, count):
+        return [{"user": user.id, "share_amount": "12.50"} for user in self.users[:count]]
+
+    def count_queries(self, method, url, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format="json")
+        self.assertIn(response.status_code, (200, 201), response.content)
+        return response, len(queries)
+
+    def test_create_query_count_does_not_grow_with_shares(self):
+        data = {"name": "dinner", "group": self.group.id, "description": "friday dinner"}
+
+        _, small = self.count_queries("post", "/expenses/expense/", {**data, "shares": self.shares(2)})
+        response, large = self.count_queries("post", "/expenses/expense/", {**data, "shares": self.shares(40)})
+
+        self.assertEqual(small, large)
+        self.assertEqual(ExpenseShare.objects.filter(expense_id=response.data["id"]).count(), 40)
+        self.assertEqual(verify_ledger(self.group.id), {})
+
+    def test_update_query_count_does_not_grow_with_shares(self):
+        expense = Expense.objects.create(name="dinner", paid_by=self.users[0], group=self.group)
+        url = f"/expenses/expense/{expense.id}/"
+
+        _, small = self.count_queries("patch", url, {"shares": self.shares(2)})
+        _, large = self.count_queries("patch", url, {"shares": self.shares(40)})
+
+        self.assertEqual(small, large)
+        self.assertEqual(expense.shares.count(), 40)
+        self.assertEqual(verify_ledger(self.group.id), {})
+
+    def test_ledger_follows_create_update_and_delete(self):
+        data = {"name": "dinner", "group": self.group.id, "description": "friday dinner", "shares": self.shares(3)}
+        response, _ = self.count_queries("post", "/expenses/expense/", data)
+        self.assertEqual(verify_ledger(self.group.id), {})
+
+        url = f"/expenses/expense/{response.data['id']}/"
+        self.count_queries("patch", url, {"shares": self.shares(5)})
+        self.assertEqual(verify_ledger(self.group.id), {})
+
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(verify_ledger(self.group.id), {})
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertEqual(self.client.patch(url, {"shares": self.shares(2)}, format="json").status_code, 404)
+        self.assertEqual(verify_ledger(self.group.id), {})
+
+    def test_cursor_pages_through_every_expense_once(self):
+        expenses = Expense.objects.bulk_create(
+            [Expense(name=f"dinner {i}", paid_by=self.users[0], group=self.group) for i in range(7)]
+        )
+        # Ties on created_at are broken by id, also across page boundaries.
+        Expense.objects.filter(pk__in=[expense.pk for expense in expenses[2:5]]).update(
+            created_at=expenses[2].created_at
+        )
+
+        seen = []
+        url = "/expenses/expense/?page_size=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            seen += [expense["id"] for expense in response.data["results"]]
+            url = response.data["next"]
+
+        expected = Expense.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+        self.assertEqual(seen, list(expected))
+        self.assertEqual(self.client.get("/expenses/expense/?cursor=bogus").status_code, 404)
+
+    def test_checkpoint_balances_match_a_replay(self):
+        def check():
+            replay = {user_id: balance for user_id, balance in calculate_balances(self.group.id).items() if balance}
+            checkpoint = checkpoint_balances(self.group.id)
+            self.assertEqual({user_id: balance for user_id, balance in checkpoint.items() if balance}, replay)
+
+        data = {"name": "dinner", "group": self.group.id, "description": "friday dinner"}
+        first, _ = self.count_queries("post", "/expenses/expense/", {**data, "shares": self.shares(4)})
+        payment = {"group": self.group.id, "payee": self.users[1].id, "amount": "5.00"}
+        self.client.force_authenticate(self.users[2])
+        self.count_queries("post", "/expenses/payment/", payment)
+        self.client.force_authenticate(self.users[0])
+        create_checkpoint(self.group.id)
+        check()
+
+        self.count_queries("post", "/expenses/expense/", {**data, "shares": self.shares(6)})
+        check()
+        self.count_queries("patch", f"/expenses/expense/{first.data['id']}/", {"shares": self.shares(3)})
+        check()
+        create_checkpoint(self.group.id)
+        self.assertEqual(self.client.delete(f"/expenses/expense/{first.data['id']}/").status_code, 204)
+        check()
+
+    def test_server_side_splits(self):
+        def create(split, shares, amount="10.00"):
+            data = {"name": "dinner", "group": self.group.id, "description": "friday", "split": split}
+            response = self.client.post(
+                "/expenses/expense/", {**data, "amount": amount, "shares": shares}, format="json"
+            )
+            self.assertEqual(response.status_code, 201, response.content)
+            return [share["share_amount"] for share in response.data["shares"]]
+
+        users = [user.id for user in self.users[:3]]
+        self.assertEqual(create("equal", [{"user": user} for user in users]), ["3.34", "3.33", "3.33"])
+        percentages = [{"user": user, "percentage": percentage} for user, percentage in zip(users, ["50", "25", "25"])]
+        self.assertEqual(create("percentage", percentages, "0.01"), ["0.01", "0.00", "0.00"])
+        weights = [{"user": user, "weight": weight} for user, weight in zip(users, ["1", "2", "2"])]
+        self.assertEqual(create("weights", weights, "0.10"), ["0.02", "0.04", "0.04"])
+        self.assertEqual(verify_ledger(self.group.id), {})
+
+    def test_exact_split_amount_must_match_the_shares(self):
+        data = {"name": "dinner", "group": self.group.id, "description": "friday", "shares": self.shares(2)}
+
+        response = self.client.post("/expenses/expense/", {**data, "amount": "30.00"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("amount", response.data)
+        self.count_queries("post", "/expenses/expense/", {**data, "amount": "25.00"})
+
+    def test_create_rejects_non_members_atomically(self):
+        outsider = User.objects.create(username="outsider", phone_number="989999999999", email="outsider@example.com")
+        data = {"name": "dinner", "group": self.group.id, "description": "friday dinner"}
+
+        for user_id in (outsider.id, outsider.id + 1000):
+            shares = self.shares(2) + [{"user": user_id, "share_amount": "1.00"}]
+            response = self.client.post("/expenses/expense/", {**data, "shares": shares}, format="json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("shares", response.data)
+        self.assertFalse(Expense.objects.exists())
+
+        response, _ = self.count_queries("post", "/expenses/expense/", {**data, "shares": self.shares(2)})
+        url = f"/expenses/expense/{response.data['id']}/"
+        shares = self.shares(1) + [{"user": outsider.id, "share_amount": "1.00"}]
+        response = self.client.patch(url, {"shares": shares}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("shares", response.data)
+        self.assertEqual(ExpenseShare.objects.count(), 2)
+        self.assertEqual(verify_ledger(self.group.id), {})
+
+    def test_members_are_checked_under_the_group_lock(self):
+        def removed_while_waiting_for_the_lock(group_id):
+            Membership.objects.filter(group_id=group_id, user=self.users[1]).delete()
+            lock_group(group_id)
+
+        data = {"name": "dinner", "group": self.group.id, "description": "friday dinner", "shares": self.shares(2)}
+        with mock.patch("expenses.serializers.lock_group", removed_while_waiting_for_the_lock):
+            response = self.client.post("/expenses/expense/", data, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Expense.objects.exists())
+
+
+@override_settings(THROTTLE_ENABLED=False)
+class ExpenseFilterTests(TestCase):
+    def setUp(self):
+        self.users = User.objects.bulk_create(
+            [User(username=f"user_{i}", phone_number=f"989{i:09d}", email=f"user_{i}@example.com") for i in range(3)]
+        )
+        self.group = Group.objects.create(name="trip", owner=self.users[0], description="trip")
+        Membership.objects.bulk_create([Membership(user=user, group=self.group) for user in self.users])
+        self.client = APIClient()
+
+        me, friend, other = self.users
+        self.taxi = self.create(me, "taxi", "to the airport", [(friend, "10.00")], day=1)
+        self.dinner = self.create(friend, "dinner", "Taxi tip included", [(other, "25.50"), (me, "4.50")], day=2)
+        self.hotel = self.create(me, "hotel", "two nights", [(other, "100.00")], day=3)
+        self.client.force_authenticate(me)
+
+    def create(self, payer, name, description, shares, day):
+        self.client.force_authenticate(payer)
+        shares = [{"user": user.id, "share_amount": amount} for user, amount in shares]
+        data = {"name": name, "group": self.group.id, "description": description, "shares": shares}
+        response = self.client.post("/expenses/expense/", data, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        Expense.objects.filter(pk=response.data["id"]).update(created_at=datetime(2024, 1, day, tzinfo=timezone.utc))
+        return response.data["id"]
+
+    def names(self, query):
+        response = self.client.get(f"/expenses/group-expenses/{self.group.id}/?{query}")
+        self.assertEqual(response.status_code, 200, response.content)
+        return sorted(expense["name"] for expense in response.data)
+
+    def test_each_filter(self):
+        me, friend, other = self.users
+        self.assertEqual(self.names(""), ["dinner", "hotel", "taxi"])
+        self.assertEqual(self.names(f"paid_by={friend.id}"), ["dinner"])
+        self.assertEqual(self.names(f"participant={other.id}"), ["dinner", "hotel"])
+        self.assertEqual(self.names(f"participant={me.id}&paid_by={friend.id}"), ["dinner"])
+        self.assertEqual(self.names("created_after=2024-01-02T00:00:00Z"), ["dinner", "hotel"])
+        self.assertEqual(self.names("created_before=2024-01-03T00:00:00Z"), ["dinner", "taxi"])
+        self.assertEqual(self.names("min_amount=30"), ["dinner", "hotel"])
+        self.assertEqual(self.names("max_amount=30.00"), ["dinner", "taxi"])
+        self.assertEqual(self.names("min_amount=10&max_amount=10"), ["taxi"])
+
+        response = self.client.get(f"/expenses/group-expenses/{self.group.id}/?min_amount=lots")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("min_amount", response.data)
+
+    def test_amount_filters_follow_share_edits(self):
+        response = self.client.patch(
+            f"/expenses/expense/{self.taxi}/",
+            {"shares": [{"user": self.users[1].id, "share_amount": "60.00"}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(self.names("min_amount=50"), ["hotel", "taxi"])
+
+    def test_search_matches_name_and_description(self):
+        self.assertEqual(self.names("search=TAXI"), ["dinner", "taxi"])
+        self.assertEqual(self.names("search=airport"), ["taxi"])
+        self.assertEqual(self.names("search=museum"), [])
+
+    def test_created_before_is_exclusive_across_pages(self):
+        # A second expense on the bound itself, which no page may include.
+        late = self.create(self.users[0], "late taxi", "home", [(self.users[1], "1.00")], day=3)
+        self.client.force_authenticate(self.users[0])
+
+        seen = []
+        url = f"/expenses/group-expenses/{self.group.id}/?created_before=2024-01-03T00:00:00Z&page_size=1"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            seen += [expense["id"] for expense in response.data["results"]]
+            url = response.data["next"]
+            self.assertLessEqual(len(seen), 2)
+        self.assertEqual(seen, [self.dinner, self.taxi])
+        self.assertNotIn(late, seen)
+
+
+class AllocateCentsTests(SimpleTestCase):
+    def test_leftover_cents_go_to_the_largest_remainders(self):
+        self.assertEqual(allocate_cents(100, [1, 1, 1]), [34, 33, 33])
+        self.assertEqual(allocate_cents(1000, [Decimal("33.33"), Decimal("33.33"), Decimal("33.34")]), [333, 333, 334])
+        self.assertEqual(allocate_cents(10, [1, 2, 2]), [2, 4, 4])
+
+    def test_parts_always_add_up(self):
+        for total in (0, 1, 7, 999, 100001):
+            for weights in ([1], [3, 1], [1, 1, 1, 1, 1, 1, 1], [Decimal("0.5"), Decimal("2.25"), 0]):
+                parts = allocate_cents(total, weights)
+                self.assertEqual(sum(parts), total)
+                self.assertTrue(all(part >= 0 for part in parts))
+
+
+class SettlementTests(SimpleTestCase):
+    # {-4, -3, 7} and {-5, 5} settle apart in 3 transfers; greedy pairs -5 with 7 first and needs 4.
+    SUBSETS = {1: Decimal("-5"), 2: Decimal("-4"), 3: Decimal("-3"), 4: Decimal("7"), 5: Decimal("5")}
+    # The same plus three pairs that cancel out: eleven balances, enough for the solver to look at the clock.
+    LARGE = {**SUBSETS, **{user_id: Decimal((-1) ** user_id * 10 * (user_id // 2)) for user_id in range(6, 12)}}
+
+    def assertSettles(self, balances, transfers):
+        left = dict(balances)
+        for transfer in transfers:
+            left[transfer["from"]] += transfer["amount"]
+            left[transfer["to"]] -= transfer["amount"]
+        self.assertFalse(any(left.values()), transfers)
+
+    def test_exact_splits_into_zero_sum_subsets(self):
+        greedy = settle_debts(self.SUBSETS)
+        exact = settle_debts_exact(self.SUBSETS)
+        self.assertSettles(self.SUBSETS, greedy)
+        self.assertSettles(self.SUBSETS, exact)
+        self.assertEqual((len(greedy), len(exact)), (4, 3))
+
+        self.assertEqual(len(settle_debts_exact(self.LARGE)), len(settle_debts(self.LARGE)) - 1)
+
+    def test_falls_back_to_greedy_above_the_participant_limit(self):
+        self.assertEqual(settle_debts_exact(self.SUBSETS, max_participants=4), settle_debts(self.SUBSETS))
+        with override_settings(SETTLEMENT_EXACT_MAX_PARTICIPANTS=4):
+            self.assertEqual(settle_debts_exact(self.SUBSETS), settle_debts(self.SUBSETS))
+
+    def test_falls_back_to_greedy_when_out_of_time(self):
+        self.assertEqual(settle_debts_exact(self.LARGE, time_budget=0), settle_debts(self.LARGE))
+
+
+@override_settings(THROTTLE_ENABLED=False)
+class SettlementPlanTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = User.objects.bulk_create(
+            [User(username=f"user_{i}", phone_number=f"989{i:09d}", email=f"user_{i}@example.com") for i in range(3)]
+        )
+        self.group = Group.objects.create(name="trip", owner=self.users[0], description="trip")
+        Membership.objects.bulk_create([Membership(user=user, group=self.group) for user in self.users])
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def plan(self):
+        response = self.client.get(f"/expenses/calculate/{self.group.id}/")
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(row["from_user"], row["to_user"], row["amount"]) for row in response.data]
+
+    def version(self):
+        return Group.objects.get(pk=self.group.pk).version
+
+    def expense(self, user, amount):
+        data = {"name": "taxi", "group": self.group.id, "description": "taxi"}
+        response = self.client.post(
+            "/expenses/expense/", {**data, "shares": [{"user": user.id, "share_amount": amount}]}, format="json"
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_writes_replace_the_cached_plan(self):
+        self.assertEqual(self.plan(), [])
+        version = self.version()
+
+        self.expense(self.users[1], "30.00")
+        self.assertGreater(self.version(), version)
+        self.assertEqual(self.plan(), [(self.users[1].id, self.users[0].id, "30.00")])
+
+        version = self.version()
+        payment = {"group": self.group.id, "payee": self.users[0].id, "amount": "10.00"}
+        self.client.force_authenticate(self.users[1])
+        self.assertEqual(self.client.post("/expenses/payment/", payment, format="json").status_code, 201)
+        self.assertGreater(self.version(), version)
+        self.assertEqual(self.plan(), [(self.users[1].id, self.users[0].id, "20.00")])
+
+    def test_a_write_that_moves_no_balance_keeps_the_cached_plan(self):
+        self.expense(self.users[1], "30.00")
+        plan = self.plan()
+        version = self.version()
+
+        # The payer's own share: they paid 10.00 and owe 10.00, so no balance moves.
+        self.expense(self.users[0], "10.00")
+        self.assertEqual(self.version(), version)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.plan(), plan)
+        self.assertFalse([query for query in queries.captured_queries if "expenses_" in query["sql"]])
+
+
+@override_settings(THROTTLE_ENABLED=False)
+class ExpenseImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="me", phone_number="989100000000", email="me@example.com")
+        self.friend = User.objects.create(username="friend", phone_number="989100000001", email="friend@example.com")
+        self.group = Group.objects.create(name="trip", owner=self.user, description="trip")
+        Membership.objects.bulk_create(
+            [Membership(user=self.user, group=self.group), Membership(user=self.friend, group=self.group)]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, body, content_type="text/csv"):
+        return self.client.post(f"/expenses/import/{self.group.id}/", body, content_type=content_type)
+
+    def csv_rows(self, count):
+        rows = [",".join(["expense", "name", "description", "paid_by", "user", "share_amount"])]
+        rows += [f"{i},taxi {i},,,{self.friend.id},10.00" for i in range(count)]
+        return "\n".join(rows).encode() + b"\n"
+
+    def test_invalid_utf8_stops_the_import_at_its_line(self):
+        response = self.post(self.csv_rows(2) + b"2,caf\xe9,,," + str(self.friend.id).encode() + b",1.00\n")
+
+        self.assertEqual(response.status_code, 201, response.content)
+        # Expense 1 is left out too: its rows might have gone on past the broken line.
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual(response.data["errors"][-1]["line"], 4)
+        self.assertIn("Nothing from line 3 on", response.data["errors"][-1]["errors"]["non_field_errors"][0])
+        self.assertEqual(verify_ledger(self.group.id), {})
+
+    def test_broken_csv_stops_the_import_at_its_line(self):
+        # A field over csv.field_size_limit() is a csv.Error.
+        response = self.post(self.csv_rows(2) + b'2,"' + b"x" * 200000 + b'",,,1,1.00\n3,taxi,,,1,1.00\n')
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual(response.data["failed"], 1)
+        self.assertEqual(response.data["errors"][-1]["line"], 4)
+
+    def test_invalid_utf8_in_jsonl_is_a_bad_request(self):
+        response = self.post(b'{"name": "caf\xe9"}\n', content_type="application/x-ndjson")
+
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertEqual(
+            response.data["errors"],
+            [
+                {
+                    "line": 1,
+                    "errors": {"non_field_errors": ["Line is not valid UTF-8. Nothing from line 1 on was imported."]},
+                }
+            ],
+        )
+
+
+class ExpenseReadDataTests(TestCase):
+    def test_matches_the_serializer_byte_for_byte(self):
+        users = User.objects.bulk_create(
+            [User(username=f"user_{i}", phone_number=f"989{i:09d}", email=f"user_{i}@example.com") for i in range(3)]
+        )
+        group = Group.objects.create(name="trip", owner=users[0], description="trip")
+        amounts = ["0.10", "5", "1234.50", "99999999.99", "0"]
+        for i, amount in enumerate(amounts):
+            expense = Expense.objects.create(name=f"taxi {i}", paid_by=users[i % 3], group=group, description="")
+            ExpenseShare.objects.bulk_create(
+                [ExpenseShare(expense=expense, user=user, share_amount=Decimal(amount)) for user in users[: i % 3 + 1]]
+            )
+        # Microseconds, and a timestamp written in another offset.
+        Expense.objects.filter(name="taxi 1").update(
+            created_at=datetime(2024, 3, 20, 23, 59, 59, 999999, tzinfo=timezone(timedelta(hours=3, minutes=30)))
+        )
+
+        expenses = Expense.objects.filter(group=group).order_by("id")
+        for time_zone in ("UTC", "Asia/Tehran"):
+            with self.subTest(time_zone=time_zone), override_settings(TIME_ZONE=time_zone):
+                expected = JSONRenderer().render(ExpenseReadSerializer(expenses, many=True).data)
+                self.assertEqual(JSONRenderer().render(expense_read_data(expenses)), expected)
+                rows = list(expenses.values(*EXPENSE_READ_FIELDS))
+                self.assertEqual(JSONRenderer().render(expense_read_data(rows)), expected)
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_reports_every_shape_mode_and_strategy(self):
+        out = io.StringIO()
+        call_command(
+            "benchmark_suite", "--sizes", "20", "--members", "6", "--repeat", "1", stdout=out, stderr=io.StringIO()
+        )
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(report["meta"]["seed"], 0)
+        self.assertEqual(len(report["results"]), len(SHAPES) * (len(BALANCE_MODES) + len(SETTLEMENT_STRATEGIES)))
+        for row in report["results"]:
+            self.assertGreaterEqual(row["best_ms"], 0)
+            if row["phase"] == "settlement":
+                self.assertLessEqual(row["transfers"], row["debtors"] + row["creditors"] - 1)
+
+        # The synthetic data is rolled back after each case.
+        self.assertFalse(Expense.objects.exists())
+
+
+class BalanceModeTests(TestCase):
+    def test_every_mode_agrees_with_a_replay(self):
+        rng = random.Random(0)
+        for shape in SHAPES:
+            group = create_synthetic_group(rng, members=8, shares=300, shares_per_expense=4, shape=shape)
+            members = list(User.objects.filter(membership__group=group).order_by("id"))
+            Payment.objects.bulk_create(
+                [
+                    Payment(group=group, payer=payer, payee=payee, amount=Decimal(rng.randint(1, 10000)) / 100)
+                    for payer, payee in (rng.sample(members, 2) for _ in range(10))
+                ]
+            )
+            create_checkpoint(group.id)
+            # Expenses and payments after the checkpoint are what the checkpoint mode replays on top of it.
+            expense = Expense.objects.create(name="late", paid_by=members[0], group=group)
+            ExpenseShare.objects.bulk_create(
+                [ExpenseShare(expense=expense, user=user, share_amount=Decimal("3.33")) for user in members[1:4]]
+            )
+            Payment.objects.create(group=group, payer=members[5], payee=members[6], amount=Decimal("7.01"))
+            rebuild_ledger(group.id)
+
+            replay = {user_id: balance for user_id, balance in calculate_balances(group.id).items() if balance}
+            self.assertEqual(sum(replay.values()), 0)
+            for mode, balances in BALANCE_MODES.items():
+                with self.subTest(shape=shape, mode=mode):
+                    self.assertEqual(
+                        {user_id: balance for user_id, balance in balances(group.id).items() if balance}, replay
+                    )
+
+
+@override_settings(THROTTLE_ENABLED=False)
+class PaymentTests(TestCase):
+    def setUp(self):
+        self.users = User.objects.bulk_create(
+            [User(username=f"user_{i}", phone_number=f"989{i:09d}", email=f"user_{i}@example.com") for i in range(4)]
+        )
+        self.group = Group.objects.create(name="trip", owner=self.users[0], description="trip")
+        Membership.objects.bulk_create([Membership(user=user, group=self.group) for user in self.users[:3]])
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def pay(self, payee, payer=None, amount="10.00"):
+        data = {"group": self.group.id, "payee": payee.id, "amount": amount}
+        if payer is not None:
+            data["payer"] = payer.id
+        return self.client.post("/expenses/payment/", data, format="json")
+
+    def test_either_side_may_record_a_payment(self):
+        response = self.pay(self.users[1])
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data["payer"], self.users[0].id)
+
+        response = self.pay(self.users[0], payer=self.users[2])
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(verify_ledger(self.group.id), {})
+
+    def test_payments_between_other_members_are_rejected(self):
+        self.assertEqual(self.pay(self.users[2], payer=self.users[1]).status_code, 400)
+        self.assertEqual(self.pay(self.users[0]).status_code, 400)
+        self.assertEqual(self.pay(self.users[3]).status_code, 400)
+        self.assertEqual(self.pay(self.users[1], amount="0.00").status_code, 400)
+        self.assertFalse(Payment.objects.exists())
+
+    def test_only_the_payer_or_payee_may_delete_a_payment(self):
+        payment = self.pay(self.users[1]).data["id"]
+
+        self.client.force_authenticate(self.users[2])
+        self.assertEqual(self.client.delete(f"/expenses/payment/{payment}/").status_code, 404)
+        self.client.force_authenticate(self.users[1])
+        self.assertEqual(self.client.delete(f"/expenses/payment/{payment}/").status_code, 204)
+        self.assertEqual(self.client.delete(f"/expenses/payment/{payment}/").status_code, 404)
+        self.assertEqual(verify_ledger(self.group.id), {})
+
+
+@override_settings(THROTTLE_ENABLED=False)
+class NetPositionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="me", phone_number="989100000000", email="me@example.com")
+        self.friend = User.objects.create(username="friend", phone_number="989100000001", email="friend@example.com")
+        self.group = Group.objects.create(name="trip", owner=self.user, description="trip")
+        Membership.objects.bulk_create(
+            [Membership(user=self.user, group=self.group), Membership(user=self.friend, group=self.group)]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def summary(self):
+        response = self.client.get("/expenses/summary/")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_summary_follows_writes_and_memberships(self):
+        self.assertEqual(self.summary()["total"], "0.00")
+
+        shares = [{"user": self.friend.id, "share_amount": "30.00"}]
+        data = {"name": "taxi", "group": self.group.id, "description": "taxi", "shares": shares}
+        self.assertEqual(self.client.post("/expenses/expense/", data, format="json").status_code, 201)
+        self.assertEqual(self.summary()["total"], "30.00")
+
+        Group.objects.filter(pk=self.group.pk).update(name="road trip")
+        self.assertEqual(self.summary()["groups"][0]["group_name"], "road trip")
+
+        Membership.objects.filter(user=self.user, group=self.group).delete()
+        self.assertEqual(self.summary()["total"], "0.00")
+        Membership.objects.create(user=self.user, group=self.group)
+        self.assertEqual(self.summary()["total"], "30.00")
+
+    def test_groups_without_activity_are_listed_at_zero(self):
+        quiet = Group.objects.create(name="book club", owner=self.friend, description="books")
+        Membership.objects.create(user=self.user, group=quiet)
+        shares = [{"user": self.friend.id, "share_amount": "30.00"}]
+        data = {"name": "taxi", "group": self.group.id, "description": "taxi", "shares": shares}
+        self.assertEqual(self.client.post("/expenses/expense/", data, format="json").status_code, 201)
+
+        summary = self.summary()
+        self.assertEqual(summary["total"], "30.00")
+        self.assertEqual(
+            [(row["group"], row["group_name"], row["balance"]) for row in summary["groups"]],
+            [(self.group.id, "trip", "30.00"), (quiet.id, "book club", "0.00")],
+        )
+
+
+@override_settings(THROTTLE_ENABLED=True, THROTTLE_USER_BURST=12, THROTTLE_USER_RATE=0.01)
+class ThrottleTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="me", phone_number="989100000000", email="me@example.com")
+        self.group = Group.objects.create(name="trip", owner=self.user, description="trip")
+        Membership.objects.create(user=self.user, group=self.group)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        buckets.clear()
+        cache.delete(f"throttle:user:{self.user.pk}")
+
+    def test_expensive_views_drain_the_bucket_faster(self):
+        # calculate costs 5: two fit in a bucket of 12, the third is refused while cheap requests still pass.
+        for _ in range(2):
+            self.assertEqual(self.client.get(f"/expenses/calculate/{self.group.id}/").status_code, 200)
+        response = self.client.get(f"/expenses/calculate/{self.group.id}/")
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+
+        self.assertEqual(self.client.get("/expenses/summary/").status_code, 200)
+
+    @override_settings(THROTTLE_ANON_BURST=20)
+    def test_anonymous_clients_cannot_pick_their_address(self):
+        # Logins cost 10. Without a proxy configured, X-Forwarded-For is the client's own word and is ignored.
+        cache.delete("throttle:ip:127.0.0.1")
+        statuses = [
+            APIClient().post("/users/login/", {}, HTTP_X_FORWARDED_FOR=f"10.0.0.{i}").status_code for i in range(3)
+        ]
+        self.assertEqual(statuses, [400, 400, 429])
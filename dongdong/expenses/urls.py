@@ -1,9 +1,26 @@
 from django.urls import path
-from expenses.views import ExpenseView, GroupExpenseView, CalculateView
+from expenses.views import (
+    ExpenseView,
+    GroupExpenseView,
+    CalculateView,
+    ExpenseImportView,
+    ExpenseExportView,
+    NetPositionView,
+    PaymentView,
+    GroupPaymentView,
+    SettleUpView,
+)
 
 urlpatterns = [
     path("expense/", ExpenseView.as_view(), name="expense-create-list"),
     path("expense/<int:pk>/", ExpenseView.as_view(), name="expense-detail-update-delete"),
     path("group-expenses/<int:pk>/", GroupExpenseView.as_view(), name="group-expenses"),
     path("calculate/<int:pk>/", CalculateView.as_view(), name="calculate"),
+    path("import/<int:pk>/", ExpenseImportView.as_view(), name="expense-import"),
+    path("export/<int:pk>/", ExpenseExportView.as_view(), name="expense-export"),
+    path("payment/", PaymentView.as_view(), name="payment-create"),
+    path("payment/<int:pk>/", PaymentView.as_view(), name="payment-delete"),
+    path("group-payments/<int:pk>/", GroupPaymentView.as_view(), name="group-payments"),
+    path("settle/<int:pk>/", SettleUpView.as_view(), name="settle-up"),
+    path("summary/", NetPositionView.as_view(), name="net-position"),
 ]
@@ -1,17 +1,48 @@
+from decimal import Decimal
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import Q
+from django.conf import settings
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
 
 from expenses.serializers import (
     ExpenseWriteSerializer,
     ExpenseReadSerializer,
     ExpenseUpdateSerializer,
-    SettlementSerializer,
+    settlement_plan,
+    PaymentWriteSerializer,
+    PaymentReadSerializer,
+    NetPositionSummarySerializer,
+    ExpenseFilterSerializer,
+    EXPENSE_READ_FIELDS,
+    expense_read_data,
 )
 from groups.models import Membership, Group
-from expenses.models import Expense, ExpenseShare
-from expenses.helper import calculate_balances, settle_debts
+from expenses.importer import read_expenses, import_expenses, check_content_type
+from expenses.exporter import EXPORTERS
+from dongdong.pagination import KeysetPagination
+from expenses.models import Expense, ExpenseShare, Payment
+from expenses.helper import (
+    is_group_member,
+    filter_expenses,
+    share_deltas,
+    payment_deltas,
+    record_payments,
+    apply_ledger_deltas,
+    invalidate_checkpoints,
+    lock_group,
+    net_position_cache_key,
+    net_position_groups,
+    settlement_cache_key,
+    net_positions,
+    SETTLEMENT_STRATEGIES,
+)
+from jobs.helper import wants_async, enqueue_job, job_accepted_response
 from django.contrib.auth import get_user_model
 
 
@@ -20,6 +51,7 @@ User = get_user_model()
 
 class ExpenseView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = {"GET": 5, "POST": 10, "PATCH": 19, "DELETE": 10}
 
     def post(self, request):
         serializer = ExpenseWriteSerializer(data=request.data, context={"request": request})
@@ -44,12 +76,23 @@ class ExpenseView(APIView):
             return Response(serializer.data)
         else:
             expenses = Expense.objects.filter(paid_by=request.user)
-            serializer = ExpenseReadSerializer(expenses, many=True)
-            return Response(serializer.data)
+            paginator = KeysetPagination("created_at")
+            page = paginator.paginate_queryset(expenses.values(*EXPENSE_READ_FIELDS), request)
+            if page is not None:
+                return paginator.get_paginated_response(expense_read_data(page))
+
+            return Response(expense_read_data(expenses))
 
     def delete(self, request, pk):
-        expense = get_object_or_404(Expense, pk=pk, paid_by=request.user)
-        expense.delete()
+        group_id = get_object_or_404(Expense.objects.values_list("group_id", flat=True), pk=pk, paid_by=request.user)
+        with transaction.atomic():
+            lock_group(group_id)
+            # Locked before its shares are read, so a concurrent delete or edit cannot undo them a second time.
+            expense = get_object_or_404(Expense.objects.select_for_update(), pk=pk, paid_by=request.user)
+            shares = ExpenseShare.objects.filter(expense=expense).values_list("user_id", "share_amount")
+            apply_ledger_deltas(expense.group_id, share_deltas(expense.paid_by_id, shares, sign=-1))
+            invalidate_checkpoints(expense.group_id, expense.id)
+            expense.delete()
         return Response({"detail": pk}, status=status.HTTP_204_NO_CONTENT)
 
     def patch(self, request, pk):
@@ -68,29 +111,203 @@ class ExpenseView(APIView):
 
 class GroupExpenseView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 5
 
     def get(self, request, pk):
         group = get_object_or_404(Group, pk=pk)
-        memberships = Membership.objects.filter(group=group)
-
-        if request.user.id not in memberships.values_list("user_id", flat=True):
+        if not is_group_member(request.user, group.id):
             return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
 
-        expenses = Expense.objects.filter(group=group)
-        serializer = ExpenseReadSerializer(expenses, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        filters = ExpenseFilterSerializer(data=request.query_params)
+        if not filters.is_valid():
+            return Response(filters.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        expenses = filter_expenses(Expense.objects.filter(group=group), filters.validated_data)
+        paginator = KeysetPagination("created_at")
+        page = paginator.paginate_queryset(expenses.values(*EXPENSE_READ_FIELDS), request)
+        if page is not None:
+            return paginator.get_paginated_response(expense_read_data(page))
+
+        return Response(expense_read_data(expenses), status=status.HTTP_200_OK)
+
+
+def invalid_strategy_response():
+    return Response(
+        {"detail": f"strategy must be one of: {', '.join(SETTLEMENT_STRATEGIES)}."},
+        status=status.HTTP_400_BAD_REQUEST,
+    )
 
 
 class CalculateView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 4
+    throttle_cost = 5
 
     def get(self, request, pk):
         memberships = Membership.objects.filter(group_id=pk)
         if request.user.id not in memberships.values_list("user_id", flat=True):
             return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
 
-        balances = calculate_balances(pk)
-        settlements = settle_debts(balances)
+        strategy = request.query_params.get("strategy", "greedy")
+        if strategy not in SETTLEMENT_STRATEGIES:
+            return invalid_strategy_response()
+
+        version = Group.objects.filter(pk=pk).values_list("version", flat=True).first()
+        if wants_async(request) and cache.get(settlement_cache_key(pk, version, strategy)) is None:
+            job = enqueue_job("calculate", request.user, {"group": pk, "strategy": strategy})
+            return job_accepted_response(job)
+
+        return Response(settlement_plan(pk, version, strategy))
+
+
+class PaymentView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    query_budget = {"POST": 15, "DELETE": 14}
+
+    def post(self, request):
+        serializer = PaymentWriteSerializer(data=request.data, context={"request": request})
+        if serializer.is_valid():
+            if not is_group_member(request.user, serializer.validated_data["group"].id):
+                return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
+
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def delete(self, request, pk):
+        mine = Q(payer=request.user) | Q(payee=request.user)
+        group_id = get_object_or_404(Payment.objects.values_list("group_id", flat=True), mine, pk=pk)
+        with transaction.atomic():
+            lock_group(group_id)
+            # Re-read under the lock: a concurrent delete of the same payment must not reverse it twice.
+            payment = get_object_or_404(Payment.objects.select_for_update(), mine, pk=pk)
+            apply_ledger_deltas(
+                payment.group_id, payment_deltas([(payment.payer_id, payment.payee_id, payment.amount)], sign=-1)
+            )
+            invalidate_checkpoints(payment.group_id, payment_id=payment.id)
+            payment.delete()
+        return Response({"detail": pk}, status=status.HTTP_204_NO_CONTENT)
+
+
+class GroupPaymentView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    query_budget = 4
+
+    def get(self, request, pk):
+        group = get_object_or_404(Group, pk=pk)
+        if not is_group_member(request.user, group.id):
+            return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
+
+        payments = Payment.objects.filter(group=group)
+        paginator = KeysetPagination("created_at")
+        page = paginator.paginate_queryset(payments, request)
+        if page is not None:
+            return paginator.get_paginated_response(PaymentReadSerializer(page, many=True).data)
+
+        return Response(PaymentReadSerializer(payments, many=True).data)
+
+
+class SettleUpView(APIView):
+    """Record every transfer of the group's current settlement plan as a payment, in one transaction."""
+
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_cost = 5
+
+    def post(self, request, pk):
+        if not is_group_member(request.user, pk):
+            return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
+
+        strategy = request.query_params.get("strategy", "greedy")
+        if strategy not in SETTLEMENT_STRATEGIES:
+            return invalid_strategy_response()
+
+        with transaction.atomic():
+            # Lock the group row so a concurrent settle-up waits and then sees the already settled balances.
+            group = get_object_or_404(Group.objects.select_for_update(), pk=pk)
+            plan = settlement_plan(group.id, group.version, strategy)
+            if not plan:
+                return Response({"detail": "Nothing to settle."}, status=status.HTTP_400_BAD_REQUEST)
+
+            payments = record_payments(
+                group.id,
+                [(transfer["from_user"], transfer["to_user"], Decimal(transfer["amount"])) for transfer in plan],
+            )
+
+        return Response(PaymentReadSerializer(payments, many=True).data, status=status.HTTP_201_CREATED)
+
+
+class ExpenseImportView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_cost = 20
+
+    def post(self, request, pk):
+        group = get_object_or_404(Group, pk=pk)
+        if not is_group_member(request.user, group.id):
+            return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
+
+        if request.stream is None:
+            return Response({"detail": "Request body is empty."}, status=status.HTTP_400_BAD_REQUEST)
+
+        content_type = request.content_type.split(";")[0].strip()
+        try:
+            check_content_type(content_type)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        if wants_async(request):
+            # The body goes to the job's input file as it arrives; request.body would hold all of it in memory and
+            # refuse anything over DATA_UPLOAD_MAX_MEMORY_SIZE.
+            payload = {"group": group.id, "content_type": content_type}
+            job = enqueue_job("import", request.user, payload, input=request.stream)
+            return job_accepted_response(job)
+
+        expenses = read_expenses(request.stream, content_type)
+
+        report = import_expenses(group.id, request.user, expenses)
+        if report["created"] == 0 and report["failed"]:
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_201_CREATED)
+
+
+class ExpenseExportView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_cost = 10
+
+    def get(self, request, pk):
+        group = get_object_or_404(Group, pk=pk)
+        if not is_group_member(request.user, group.id):
+            return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
+
+        output = request.query_params.get("output", "csv")
+        if output not in EXPORTERS:
+            return Response(
+                {"detail": f"output must be one of: {', '.join(EXPORTERS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if wants_async(request):
+            job = enqueue_job("export", request.user, {"group": group.id, "output": output})
+            return job_accepted_response(job)
+
+        exporter, content_type = EXPORTERS[output]
+        response = StreamingHttpResponse(exporter(group.id), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="group-{group.id}-expenses.{output}"'
+        return response
+
+
+class NetPositionView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    query_budget = 4
+
+    def get(self, request):
+        groups = net_position_groups(request.user)
+        key = net_position_cache_key(request.user.id, groups)
+        summary = cache.get(key)
+        if summary is None:
+            positions = net_positions(request.user, groups)
+            total = sum((position["balance"] for position in positions), Decimal(0))
+            summary = NetPositionSummarySerializer({"total": total, "groups": positions}).data
+            cache.set(key, summary, timeout=settings.NET_POSITION_CACHE_TIMEOUT)
 
-        serializer = SettlementSerializer(settlements, many=True)
-        return Response(serializer.data)
+        return Response(summary)
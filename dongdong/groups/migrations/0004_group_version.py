@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("groups", "0003_group_description_alter_groupinvitation_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="group",
+            name="version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
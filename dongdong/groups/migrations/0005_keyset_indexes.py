@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-18 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("groups", "0004_group_version"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="groupinvitation",
+            index=models.Index(
+                fields=["group", "invited_at", "id"],
+                name="invitation_group_invited_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="groupinvitation",
+            index=models.Index(
+                fields=["invited_user", "invited_at", "id"],
+                name="invitation_user_invited_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="groupjoinrequest",
+            index=models.Index(
+                fields=["group", "requested_at", "id"], name="joinrequest_group_req_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="membership",
+            index=models.Index(
+                fields=["group", "joined_at", "id"], name="membership_group_joined_idx"
+            ),
+        ),
+    ]
@@ -7,6 +7,7 @@ class Group(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     description = models.TextField(max_length=511)
+    version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
@@ -25,6 +26,7 @@ class Membership(models.Model):
 
     class Meta:
         unique_together = ("user", "group")
+        indexes = [models.Index(fields=["group", "joined_at", "id"], name="membership_group_joined_idx")]
 
     def __str__(self):
         return f"{self.user} in {self.group} as {self.role}"
@@ -55,6 +57,7 @@ class GroupJoinRequest(models.Model):
 
     class Meta:
         unique_together = ("user", "group")
+        indexes = [models.Index(fields=["group", "requested_at", "id"], name="joinrequest_group_req_idx")]
 
     def __str__(self):
         return f"JoinRequest by {self.user} to {self.group}"
@@ -83,5 +86,11 @@ class GroupInvitation(models.Model):
     status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
     responded_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["group", "invited_at", "id"], name="invitation_group_invited_idx"),
+            models.Index(fields=["invited_user", "invited_at", "id"], name="invitation_user_invited_idx"),
+        ]
+
     def __str__(self):
         return f"Invitation to {self.invited_user} for {self.group}"
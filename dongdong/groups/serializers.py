@@ -1,5 +1,7 @@
 from rest_framework import serializers
+from django.db.models import QuerySet
 from groups.models import Group, Membership, GroupJoinRequest, GroupInvitation
+from users.helpers import normalize_phone_number
 from users.models import User
 from datetime import datetime
 
@@ -119,6 +121,32 @@ class MembershipReadSerializer(serializers.ModelSerializer):
         fields = ["user_id", "user_phone", "group", "role", "id", "joined_at"]
 
 
+MEMBERSHIP_READ_FIELDS = ["user_id", "user__phone_number", "group_id", "role", "id", "joined_at"]
+datetime_field = serializers.DateTimeField()
+
+
+def membership_read_data(memberships):
+    """
+    Fast path for MembershipReadSerializer(memberships, many=True).data, producing the same JSON.
+
+    `memberships` is a Membership queryset, or a page of its .values(*MEMBERSHIP_READ_FIELDS) rows.
+    """
+    if isinstance(memberships, QuerySet):
+        memberships = memberships.values(*MEMBERSHIP_READ_FIELDS)
+
+    return [
+        {
+            "user_id": membership["user_id"],
+            "user_phone": membership["user__phone_number"],
+            "group": membership["group_id"],
+            "role": membership["role"],
+            "id": membership["id"],
+            "joined_at": datetime_field.to_representation(membership["joined_at"]),
+        }
+        for membership in memberships
+    ]
+
+
 class MembershipWriteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Membership
@@ -168,6 +196,7 @@ class InvitationByPhoneSerializer(serializers.Serializer):
     inviting_username = serializers.CharField(read_only=True)
 
     def validate_phone_number(self, value):
+        value = normalize_phone_number(value) or value
         try:
             user = User.objects.get(phone_number=value)
             return value
@@ -1,3 +1,77 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from dongdong.query_budget import QueryBudgetMixin
+from groups.models import Group, GroupInvitation, GroupJoinRequest, Membership
+from groups.serializers import MEMBERSHIP_READ_FIELDS, MembershipReadSerializer, membership_read_data
+from groups.views import GroupView, InvitationView, JoinRequestView, UserInvitationsView
+from users.models import User
+
+
+class GroupListQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="me", phone_number="989100000000", email="me@example.com")
+        self.invited = User.objects.create(username="guest", phone_number="989200000000", email="guest@example.com")
+        self.groups = 0
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.guest_client = APIClient()
+        self.guest_client.force_authenticate(self.invited)
+
+    def add_groups(self, count):
+        """Give the user `count` more groups, each with its own owner, invitation and join request."""
+        owners = User.objects.bulk_create(
+            [
+                User(username=f"owner_{i}", phone_number=f"989300{i:06d}", email=f"owner_{i}@example.com")
+                for i in range(self.groups, self.groups + count)
+            ]
+        )
+        for owner in owners:
+            group = Group.objects.create(name=owner.username, owner=owner, description="trip")
+            Membership.objects.create(user=owner, group=group, role=Membership.Role.OWNER)
+            Membership.objects.create(user=self.user, group=group, role=Membership.Role.ADMIN)
+            GroupInvitation.objects.create(group=group, invited_user=self.invited, invited_by=owner)
+            GroupJoinRequest.objects.create(group=group, user=self.invited)
+        self.groups += count
+
+    def assertListsWithinBudget(self):
+        with self.assertQueryBudget(GroupView, "GET"):
+            self.assertEqual(len(self.client.get("/groups/group/").data), self.groups)
+        with self.assertQueryBudget(JoinRequestView, "GET"):
+            self.assertEqual(len(self.guest_client.get("/groups/join-request/").data), self.groups)
+        with self.assertQueryBudget(InvitationView, "GET"):
+            self.assertEqual(len(self.guest_client.get("/groups/invitation/").data), self.groups)
+        with self.assertQueryBudget(UserInvitationsView, "GET"):
+            self.assertEqual(len(self.guest_client.get("/groups/my-invitations/").data), self.groups)
+
+    def test_list_queries_do_not_grow_with_groups(self):
+        self.add_groups(2)
+        self.assertListsWithinBudget()
+        self.add_groups(10)
+        self.assertListsWithinBudget()
+
+
+class MembershipReadDataTests(TestCase):
+    def test_matches_the_serializer_byte_for_byte(self):
+        owner = User.objects.create(username="owner", phone_number="989100000000", email="owner@example.com")
+        group = Group.objects.create(name="trip", owner=owner, description="trip")
+        Membership.objects.create(user=owner, group=group, role=Membership.Role.OWNER)
+        for i, role in enumerate([Membership.Role.ADMIN, Membership.Role.MEMBER]):
+            user = User.objects.create(username=f"user_{i}", phone_number=f"98920000000{i}")
+            Membership.objects.create(user=user, group=group, role=role)
+        # Microseconds, and a timestamp written in another offset.
+        Membership.objects.filter(role=Membership.Role.ADMIN).update(
+            joined_at=datetime(2024, 3, 20, 23, 59, 59, 999999, tzinfo=timezone(timedelta(hours=3, minutes=30)))
+        )
+
+        memberships = Membership.objects.filter(group=group).order_by("id")
+        for time_zone in ("UTC", "Asia/Tehran"):
+            with self.subTest(time_zone=time_zone), override_settings(TIME_ZONE=time_zone):
+                expected = JSONRenderer().render(MembershipReadSerializer(memberships, many=True).data)
+                self.assertEqual(JSONRenderer().render(membership_read_data(memberships)), expected)
+                rows = list(memberships.values(*MEMBERSHIP_READ_FIELDS))
+                self.assertEqual(JSONRenderer().render(membership_read_data(rows)), expected)
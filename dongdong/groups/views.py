@@ -18,9 +18,12 @@ from groups.serializers import (
     InvitationUpdateSerializer,
     InvitationByPhoneSerializer,
     InvitationListSerializer,
+    MEMBERSHIP_READ_FIELDS,
+    membership_read_data,
 )
 from groups.models import Group, GroupJoinRequest, Membership, GroupInvitation
 from users.models import User
+from dongdong.pagination import KeysetPagination
 from groups.permissions import (
     IsGroupAdminOrOwnerWhitGroup,
     IsGroupAdminOrOwnerWhitRequest,
@@ -29,6 +32,8 @@ from groups.permissions import (
 
 
 class GroupView(APIView):
+    query_budget = {"GET": 2}
+
     def get_permissions(self):
         if self.request.method == "PATCH":
             permission_classes = [IsGroupAdminOrOwnerWhitGroup, permissions.IsAuthenticated]
@@ -62,18 +67,22 @@ class GroupView(APIView):
 
     def get(self, request, pk=None):
         if pk is None:
-            memberships = Membership.objects.filter(user=request.user)
+            memberships = Membership.objects.filter(user=request.user).select_related("group__owner")
             groups = [membership.group for membership in memberships]
             serializer = GroupReadSerializer(groups, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
         else:
-            membership = get_object_or_404(Membership, group_id=pk, user=request.user)
+            membership = get_object_or_404(
+                Membership.objects.select_related("group__owner"), group_id=pk, user=request.user
+            )
             group = membership.group
             serializer = GroupReadSerializer(group)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 class JoinRequestView(APIView):
+    query_budget = {"GET": 4}
+
     def get_permissions(self):
         if self.request.method == "PATCH":
             permission_classes = [IsGroupAdminOrOwnerWhitRequest, permissions.IsAuthenticated]
@@ -109,7 +118,7 @@ class JoinRequestView(APIView):
             serializer = JoinRequestReadSerializer(join_request)
             return Response(serializer.data)
         else:
-            join_requests = GroupJoinRequest.objects.filter(user=request.user)
+            join_requests = GroupJoinRequest.objects.filter(user=request.user).select_related("group")
             serializer = JoinRequestReadSerializer(join_requests, many=True)
             return Response(serializer.data)
 
@@ -128,16 +137,24 @@ class JoinRequestView(APIView):
 
 class GroupJoinRequestView(APIView):
     permission_classes = [permissions.IsAuthenticated, IsGroupAdminOrOwnerWhitGroup]
+    query_budget = 3
 
     def get(self, request, pk):
         group = get_object_or_404(Group, pk=pk)
 
-        requests = GroupJoinRequest.objects.filter(group=group)
+        requests = GroupJoinRequest.objects.filter(group=group).select_related("group")
+        paginator = KeysetPagination("requested_at")
+        page = paginator.paginate_queryset(requests, request)
+        if page is not None:
+            return paginator.get_paginated_response(JoinRequestReadSerializer(page, many=True).data)
+
         serializer = JoinRequestReadSerializer(requests, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 class MembershipView(APIView):
+    query_budget = {"GET": 5}
+
     def get_permissions(self):
         if self.request.method in ["PATCH", "DELETE"]:
             permission_classes = [IsGroupAdminOrOwnerWhitMembership, permissions.IsAuthenticated]
@@ -173,8 +190,7 @@ class MembershipView(APIView):
 
         else:
             memberships = Membership.objects.filter(user=request.user)
-            serializer = MembershipReadSerializer(memberships, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return Response(membership_read_data(memberships), status=status.HTTP_200_OK)
 
     def delete(self, request, pk):
         membership = get_object_or_404(Membership, pk=pk)
@@ -196,17 +212,23 @@ class MembershipView(APIView):
 
 class GroupMembershipView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 3
 
     def get(self, request, pk):
         is_member = get_object_or_404(Membership, group_id=pk, user=request.user)
 
         members = Membership.objects.filter(group_id=pk)
-        serializer = MembershipReadSerializer(members, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        paginator = KeysetPagination("joined_at")
+        page = paginator.paginate_queryset(members.values(*MEMBERSHIP_READ_FIELDS), request)
+        if page is not None:
+            return paginator.get_paginated_response(membership_read_data(page))
+
+        return Response(membership_read_data(members), status=status.HTTP_200_OK)
 
 
 class InvitationView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = {"GET": 6}
 
     def post(self, request):
         serializer = InvitationWriteSerializer(data=request.data, context={"request": request})
@@ -245,7 +267,9 @@ class InvitationView(APIView):
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         else:
-            invitations = GroupInvitation.objects.filter(invited_user=request.user)
+            invitations = GroupInvitation.objects.filter(invited_user=request.user).select_related(
+                "invited_user", "invited_by"
+            )
             serializer = InvitationReadSerializer(invitations, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -300,6 +324,7 @@ class InvitationView(APIView):
 
 class GroupInvitationView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 4
 
     def get(self, request, pk):
         group = get_object_or_404(Group, pk=pk)
@@ -309,7 +334,11 @@ class GroupInvitationView(APIView):
         if request.user.id not in admins.values_list("user_id", flat=True):
             return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
 
-        invitations = GroupInvitation.objects.filter(group=group)
+        invitations = GroupInvitation.objects.filter(group=group).select_related("invited_user", "invited_by")
+        paginator = KeysetPagination("invited_at")
+        page = paginator.paginate_queryset(invitations, request)
+        if page is not None:
+            return paginator.get_paginated_response(InvitationReadSerializer(page, many=True).data)
 
         serializer = InvitationReadSerializer(invitations, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -356,13 +385,20 @@ class InviteByPhoneView(APIView):
 
 class UserInvitationsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 2
 
     def get(self, request):
         """Get all invitations for the current user"""
-        invitations = GroupInvitation.objects.filter(
-            invited_user=request.user
-        ).order_by('-invited_at')
-        
+        invitations = (
+            GroupInvitation.objects.filter(invited_user=request.user)
+            .select_related("invited_user", "invited_by", "group")
+            .order_by("-invited_at")
+        )
+        paginator = KeysetPagination("invited_at")
+        page = paginator.paginate_queryset(invitations, request)
+        if page is not None:
+            return paginator.get_paginated_response(InvitationListSerializer(page, many=True).data)
+
         serializer = InvitationListSerializer(invitations, many=True)
         return Response(serializer.data)
 
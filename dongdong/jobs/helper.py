@@ -0,0 +1,137 @@
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Max, Min, Q
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from expenses.tasks import calculate_job, export_job, import_job
+from jobs.models import Job, JobLost
+
+logger = logging.getLogger(__name__)
+
+# Each handler takes the Job and returns (result, output): a JSON-serializable result and optionally the name
+# of a file it saved to the default storage (e.g. an export), which the result endpoint serves instead.
+JOB_HANDLERS = {
+    "calculate": calculate_job,
+    "export": export_job,
+    "import": import_job,
+}
+
+
+def wants_async(request):
+    return request.query_params.get("async", "").lower() in ("1", "true")
+
+
+def enqueue_job(kind, owner, payload, input=None):
+    """
+    Queue a job. `input` is an optional binary stream, such as a request body, copied to the jobs storage chunk
+    by chunk so that uploads of any size pass through without being held in memory.
+    """
+    job = Job(kind=kind, owner=owner, payload=payload)
+    if input is not None:
+        job.input_file.save(uuid.uuid4().hex, File(input), save=False)
+    job.save()
+    return job
+
+
+def job_accepted_response(job):
+    return Response(
+        {"job": job.id, "status": job.status},
+        status=status.HTTP_202_ACCEPTED,
+        headers={"Location": reverse("job-detail", args=[job.id])},
+    )
+
+
+def claim_jobs(limit):
+    """
+    Mark up to `limit` queued jobs as running and return their ids, oldest first.
+
+    A running job whose worker sent no heartbeat for JOBS_STALE_AFTER seconds (it died) is claimed again, up to
+    JOBS_MAX_ATTEMPTS attempts in all; after that it fails. SKIP LOCKED lets several run_jobs processes share the
+    queue without claiming the same job twice.
+    """
+    now = timezone.now()
+    stale = Q(status=Job.Status.RUNNING, heartbeat_at__lt=now - timedelta(seconds=settings.JOBS_STALE_AFTER))
+    with transaction.atomic():
+        Job.objects.filter(stale, attempts__gte=settings.JOBS_MAX_ATTEMPTS).update(
+            status=Job.Status.FAILED, error="The job's worker stopped responding on every attempt.", finished_at=now
+        )
+        ids = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=Job.Status.QUEUED) | stale)
+            .order_by("id")
+            .values_list("id", flat=True)[:limit]
+        )
+        Job.objects.filter(id__in=ids).update(
+            status=Job.Status.RUNNING, started_at=now, heartbeat_at=now, attempts=F("attempts") + 1
+        )
+    return ids
+
+
+def fail_job(job_id, error, attempts=None):
+    jobs = Job.objects.filter(pk=job_id)
+    if attempts is not None:
+        jobs = jobs.filter(attempts=attempts)
+    jobs.update(status=Job.Status.FAILED, error=str(error) or error.__class__.__name__, finished_at=timezone.now())
+
+
+def run_job(job_id):
+    job = Job.objects.select_related("owner").get(pk=job_id)
+    try:
+        result, output = JOB_HANDLERS[job.kind](job)
+    except JobLost:
+        logger.warning("Job %s (%s) was claimed again, dropping attempt %s", job.id, job.kind, job.attempts)
+        return Job.Status.RUNNING
+    except Exception as e:
+        logger.exception("Job %s (%s) failed", job.id, job.kind)
+        fail_job(job.id, e, attempts=job.attempts)
+        status = Job.Status.FAILED
+    else:
+        # Only the latest attempt may finish the job.
+        Job.objects.filter(pk=job.id, attempts=job.attempts).update(
+            status=Job.Status.DONE, result=result, output_file=output, finished_at=timezone.now()
+        )
+        status = Job.Status.DONE
+
+    # Nothing reads the input of a finished job again.
+    if job.input_file:
+        job.input_file.delete(save=False)
+        Job.objects.filter(pk=job.id).update(input_file=None)
+    return status
+
+
+def job_stats():
+    """Queue depth, jobs per status and per-kind durations of the jobs finished within JOBS_STATS_WINDOW."""
+    now = timezone.now()
+    counts = dict(Job.objects.order_by().values_list("status").annotate(count=Count("id")))
+    oldest = Job.objects.filter(status=Job.Status.QUEUED).aggregate(oldest=Min("created_at"))["oldest"]
+
+    duration = ExpressionWrapper(F("finished_at") - F("started_at"), output_field=DurationField())
+    finished = (
+        Job.objects.filter(status=Job.Status.DONE, finished_at__gte=now - timedelta(seconds=settings.JOBS_STATS_WINDOW))
+        .order_by("kind")
+        .values("kind")
+        .annotate(count=Count("id"), average=Avg(duration), longest=Max(duration))
+    )
+
+    return {
+        "queue_depth": counts.get(Job.Status.QUEUED, 0),
+        "oldest_queued_seconds": (now - oldest).total_seconds() if oldest else None,
+        "statuses": {choice: counts.get(choice, 0) for choice in Job.Status.values},
+        "kinds": [
+            {
+                "kind": row["kind"],
+                "count": row["count"],
+                "average_seconds": row["average"].total_seconds(),
+                "longest_seconds": row["longest"].total_seconds(),
+            }
+            for row in finished
+        ],
+    }
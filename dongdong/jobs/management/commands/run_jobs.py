@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from jobs.helper import claim_jobs, fail_job, run_job
+from jobs.worker import execute, init_worker
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (settlements, exports, imports) in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.JOBS_WORKERS,
+            help="Worker processes; 0 runs jobs one by one in this process.",
+        )
+        parser.add_argument("--poll-interval", type=float, default=settings.JOBS_POLL_INTERVAL)
+        parser.add_argument("--once", action="store_true", help="Exit as soon as the queue is empty.")
+
+    def handle(self, *args, **options):
+        if options["workers"] == 0:
+            self.run_inline(options["poll_interval"], options["once"])
+        else:
+            self.run_pool(options["workers"], options["poll_interval"], options["once"])
+
+    def run_inline(self, poll_interval, once):
+        while True:
+            claimed = claim_jobs(1)
+            if not claimed:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+            self.report(claimed[0], run_job(claimed[0]))
+
+    def run_pool(self, workers, poll_interval, once):
+        # Workers are spawned rather than forked so none of them inherits this process's database connection.
+        connections.close_all()
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(os.environ["DJANGO_SETTINGS_MODULE"],),
+        )
+        running = {}
+        with pool:
+            while True:
+                if len(running) < workers:
+                    for job_id in claim_jobs(workers - len(running)):
+                        running[pool.submit(execute, job_id)] = job_id
+
+                if not running:
+                    if once:
+                        return
+                    time.sleep(poll_interval)
+                    continue
+
+                done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        self.report(job_id, future.result())
+                    except BrokenProcessPool as e:
+                        for other_id in [job_id, *running.values()]:
+                            fail_job(other_id, e)
+                        raise CommandError("A worker process died; its jobs were marked as failed.")
+
+    def report(self, job_id, status):
+        self.stdout.write(f"job {job_id}: {status}")
@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 05:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("jobs", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="job",
+            name="input",
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="input_file",
+            field=models.FileField(blank=True, null=True, upload_to="jobs/input/"),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-18 05:05
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_heartbeats(apps, schema_editor):
+    # Jobs already running count as having last been heard of when they started, and as on their first attempt.
+    Job = apps.get_model("jobs", "Job")
+    Job.objects.filter(status="running").update(
+        heartbeat_at=F("started_at"), attempts=1
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("jobs", "0002_job_input_file"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="attempts",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="heartbeat_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="progress",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_heartbeats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 05:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("jobs", "0003_job_heartbeat"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="job",
+            name="output",
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="output_file",
+            field=models.FileField(blank=True, null=True, upload_to="jobs/output/"),
+        ),
+    ]
@@ -0,0 +1,50 @@
+from django.db import models
+from django.conf import settings
+from django.utils import timezone
+
+
+class JobLost(Exception):
+    """The job was handed to another worker after this one missed its heartbeats."""
+
+
+class Job(models.Model):
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    kind = models.CharField(max_length=31)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="jobs")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    payload = models.JSONField(default=dict)
+    input_file = models.FileField(upload_to="jobs/input/", null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    output_file = models.FileField(upload_to="jobs/output/", null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    progress = models.JSONField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "id"], name="job_status_idx")]
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} ({self.status})"
+
+    def heartbeat(self, **fields):
+        """
+        Tell claim_jobs that this attempt is alive, saving `fields` (such as progress) with it. Raises JobLost if
+        the job has been claimed again since; called inside a transaction, that rolls back the attempt's writes.
+        """
+        if not Job.objects.filter(pk=self.pk, attempts=self.attempts).update(heartbeat_at=timezone.now(), **fields):
+            raise JobLost(f"Job {self.pk} was claimed again after attempt {self.attempts}.")
+
+    @property
+    def duration(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
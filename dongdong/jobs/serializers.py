@@ -0,0 +1,11 @@
+from rest_framework import serializers
+
+from jobs.models import Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    duration = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Job
+        fields = ["id", "kind", "status", "payload", "error", "created_at", "started_at", "finished_at", "duration"]
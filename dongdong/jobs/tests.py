@@ -0,0 +1,237 @@
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from expenses.helper import verify_ledger
+from expenses.models import Expense
+from groups.models import Group, Membership
+from jobs.helper import claim_jobs, run_job
+from jobs.models import Job, JobLost
+from users.models import User
+
+
+class JobTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        overrides = override_settings(MEDIA_ROOT=media_root, THROTTLE_ENABLED=False)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.user = User.objects.create(username="me", phone_number="989100000000", email="me@example.com")
+        self.friend = User.objects.create(username="friend", phone_number="989100000001", email="friend@example.com")
+        self.group = Group.objects.create(name="trip", owner=self.user, description="trip")
+        Membership.objects.bulk_create(
+            [Membership(user=self.user, group=self.group), Membership(user=self.friend, group=self.group)]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def run_queued(self):
+        return [run_job(job_id) for job_id in claim_jobs(10)]
+
+    def import_body(self, count):
+        rows = [f"{i},taxi {i},,,{self.friend.id},10.00" for i in range(count)]
+        return ("expense,name,description,paid_by,user,share_amount\n" + "\n".join(rows) + "\n").encode()
+
+    def enqueue_import(self, body):
+        response = self.client.post(f"/expenses/import/{self.group.id}/?async=1", body, content_type="text/csv")
+        self.assertEqual(response.status_code, 202, response.content)
+        return Job.objects.get(pk=response.data["job"])
+
+
+class ClaimJobsTests(JobTestCase):
+    def enqueue(self, **fields):
+        return Job.objects.create(kind="calculate", owner=self.user, payload={"group": self.group.id}, **fields)
+
+    def test_a_job_is_claimed_once(self):
+        job = self.enqueue()
+
+        self.assertEqual(claim_jobs(10), [job.id])
+        self.assertEqual(claim_jobs(10), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.RUNNING, 1))
+
+    @override_settings(JOBS_STALE_AFTER=60, JOBS_MAX_ATTEMPTS=2)
+    def test_silent_jobs_are_claimed_again_until_out_of_attempts(self):
+        silent = timezone.now() - timedelta(seconds=120)
+        alive = self.enqueue(status=Job.Status.RUNNING, heartbeat_at=timezone.now(), attempts=1)
+        retried = self.enqueue(status=Job.Status.RUNNING, heartbeat_at=silent, attempts=1)
+        exhausted = self.enqueue(status=Job.Status.RUNNING, heartbeat_at=silent, attempts=2)
+
+        self.assertEqual(claim_jobs(10), [retried.id])
+        retried.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual(retried.attempts, 2)
+        self.assertEqual(exhausted.status, Job.Status.FAILED)
+        self.assertEqual(Job.objects.get(pk=alive.pk).status, Job.Status.RUNNING)
+
+    def test_a_superseded_attempt_cannot_report_progress(self):
+        job = self.enqueue()
+        claim_jobs(1)
+        first = Job.objects.get(pk=job.pk)
+        Job.objects.filter(pk=job.pk).update(attempts=2)
+
+        with self.assertRaises(JobLost):
+            first.heartbeat(progress={"line": 1})
+        self.assertIsNone(Job.objects.get(pk=job.pk).progress)
+
+
+class ImportJobTests(JobTestCase):
+    def test_async_import_is_not_limited_by_the_request_body_size(self):
+        body = self.import_body(200)
+        with override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=1024):
+            response = self.client.post(f"/expenses/import/{self.group.id}/?async=1", body, content_type="text/csv")
+        self.assertEqual(response.status_code, 202, response.content)
+
+        job = Job.objects.get(pk=response.data["job"])
+        with job.input_file.open("rb") as stored:
+            self.assertEqual(stored.read(), body)
+
+        self.assertEqual(self.run_queued(), [Job.Status.DONE])
+        job.refresh_from_db()
+        self.assertEqual(job.result["created"], 200)
+        self.assertFalse(job.input_file)
+        self.assertEqual(Expense.objects.filter(group=self.group).count(), 200)
+        self.assertEqual(verify_ledger(self.group.id), {})
+
+    @override_settings(EXPENSES_IMPORT_CHUNK_SIZE=50)
+    def test_a_retried_import_resumes_after_its_last_chunk(self):
+        job = self.enqueue_import(self.import_body(200) + b"bad,,,,,\n")
+        heartbeat = Job.heartbeat
+        calls = []
+
+        def die_on_third_chunk(job, **fields):
+            calls.append(fields)
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            heartbeat(job, **fields)
+
+        with mock.patch.object(Job, "heartbeat", die_on_third_chunk), self.assertRaises(KeyboardInterrupt):
+            self.run_queued()
+        self.assertEqual(Expense.objects.filter(group=self.group).count(), 100)
+
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(self.run_queued(), [Job.Status.DONE])
+        job.refresh_from_db()
+        self.assertEqual((job.attempts, job.result["created"], job.result["failed"]), (2, 200, 1))
+        self.assertEqual(Expense.objects.filter(group=self.group).count(), 200)
+        self.assertEqual(verify_ledger(self.group.id), {})
+
+
+class HeartbeatTests(JobTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def count_heartbeats(self):
+        heartbeat = Job.heartbeat
+        calls = []
+
+        def counted(job, **fields):
+            calls.append(fields)
+            heartbeat(job, **fields)
+
+        patcher = mock.patch.object(Job, "heartbeat", counted)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return calls
+
+    @override_settings(EXPENSES_IMPORT_CHUNK_SIZE=50)
+    def test_an_import_of_invalid_rows_keeps_sending_heartbeats(self):
+        rows = "".join(f"{i},taxi {i},,,{self.friend.id},lots\n" for i in range(120))
+        job = self.enqueue_import(("expense,name,description,paid_by,user,share_amount\n" + rows).encode())
+        calls = self.count_heartbeats()
+
+        self.assertEqual(self.run_queued(), [Job.Status.DONE])
+        self.assertEqual([fields["progress"]["line"] for fields in calls], [51, 101])
+        job.refresh_from_db()
+        self.assertEqual((job.result["created"], job.result["failed"]), (0, 120))
+
+    def test_calculate_sends_heartbeats_around_the_balances(self):
+        response = self.client.get(f"/expenses/calculate/{self.group.id}/?async=1")
+        self.assertEqual(response.status_code, 202, response.content)
+        calls = self.count_heartbeats()
+
+        self.assertEqual(self.run_queued(), [Job.Status.DONE])
+        self.assertEqual(len(calls), 2)
+
+    def test_a_calculate_claimed_again_meanwhile_does_not_finish(self):
+        job_id = self.client.get(f"/expenses/calculate/{self.group.id}/?async=1").data["job"]
+        heartbeat = Job.heartbeat
+
+        def claimed_again(job, **fields):
+            Job.objects.filter(pk=job.pk).update(attempts=F("attempts") + 1)
+            heartbeat(job, **fields)
+
+        with mock.patch.object(Job, "heartbeat", claimed_again):
+            self.assertEqual(self.run_queued(), [Job.Status.RUNNING])
+        job = Job.objects.get(pk=job_id)
+        self.assertEqual((job.status, job.result), (Job.Status.RUNNING, None))
+
+
+class JobResultTests(JobTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        for i in range(3):
+            data = {"name": f"taxi {i}", "group": self.group.id, "description": "taxi"}
+            shares = [{"user": self.friend.id, "share_amount": "10.00"}]
+            response = self.client.post("/expenses/expense/", {**data, "shares": shares}, format="json")
+            self.assertEqual(response.status_code, 201, response.content)
+
+    def enqueue(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response["Location"], f"/jobs/job/{response.data['job']}/")
+        return response.data["job"]
+
+    def result(self, job_id):
+        return self.client.get(f"/jobs/job/{job_id}/result/")
+
+    def test_export_is_served_from_storage(self):
+        job_id = self.enqueue(f"/expenses/export/{self.group.id}/?async=1&output=csv")
+        self.assertEqual(self.result(job_id).status_code, 202)
+
+        out = io.StringIO()
+        call_command("run_jobs", "--workers", "0", "--once", stdout=out)
+        self.assertEqual(out.getvalue(), f"job {job_id}: done\n")
+
+        response = self.result(job_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn('filename="group-', response["Content-Disposition"])
+        body = b"".join(response.streaming_content).decode()
+        self.assertEqual(
+            body, b"".join(self.client.get(f"/expenses/export/{self.group.id}/").streaming_content).decode()
+        )
+        self.assertEqual(len(body.splitlines()), 4)
+
+    def test_calculate_result_and_status(self):
+        job_id = self.enqueue(f"/expenses/calculate/{self.group.id}/?async=1")
+        self.run_queued()
+
+        status = self.client.get(f"/jobs/job/{job_id}/")
+        self.assertEqual((status.status_code, status.data["status"]), (200, Job.Status.DONE))
+        response = self.result(job_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [{"from_user": self.friend.id, "to_user": self.user.id, "amount": "30.00"}])
+
+    def test_failed_jobs_and_other_users_jobs(self):
+        job_id = self.enqueue(f"/expenses/calculate/{self.group.id}/?async=1")
+        Job.objects.filter(pk=job_id).update(payload={"group": self.group.id, "strategy": "unknown"})
+        self.assertEqual(self.run_queued(), [Job.Status.FAILED])
+        self.assertEqual(self.result(job_id).status_code, 409)
+
+        self.client.force_authenticate(self.friend)
+        self.assertEqual(self.client.get(f"/jobs/job/{job_id}/").status_code, 404)
+        self.assertEqual(self.result(job_id).status_code, 404)
@@ -0,0 +1,8 @@
+from django.urls import path
+from jobs.views import JobView, JobResultView, JobStatsView
+
+urlpatterns = [
+    path("job/<int:pk>/", JobView.as_view(), name="job-detail"),
+    path("job/<int:pk>/result/", JobResultView.as_view(), name="job-result"),
+    path("stats/", JobStatsView.as_view(), name="job-stats"),
+]
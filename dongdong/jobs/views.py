@@ -0,0 +1,44 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status, permissions
+from django.shortcuts import get_object_or_404
+from django.http import FileResponse
+
+from jobs.models import Job
+from jobs.serializers import JobSerializer
+from jobs.helper import job_stats
+
+
+class JobView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        job = get_object_or_404(Job.objects.defer("result", "progress"), pk=pk, owner=request.user)
+        return Response(JobSerializer(job).data)
+
+
+class JobResultView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        job = get_object_or_404(Job.objects.defer("progress"), pk=pk, owner=request.user)
+        if job.status == Job.Status.FAILED:
+            return Response(JobSerializer(job).data, status=status.HTTP_409_CONFLICT)
+        if job.status != Job.Status.DONE:
+            return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+        if job.output_file:
+            return FileResponse(
+                job.output_file.open("rb"),
+                as_attachment=True,
+                filename=job.result["filename"],
+                content_type=job.result["content_type"],
+            )
+        return Response(job.result)
+
+
+class JobStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(job_stats())
@@ -0,0 +1,16 @@
+import os
+
+import django
+
+
+def init_worker(settings_module):
+    """Process pool initializer: spawned workers start from a bare interpreter and need Django set up."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    django.setup()
+
+
+def execute(job_id):
+    # Imported here so that unpickling this function in a fresh worker does not load models before setup.
+    from jobs.helper import run_job
+
+    return run_job(job_id)
@@ -1,8 +1,8 @@
-from users.helpers import get_user_from_token, decode_token
+from users.helpers import decode_token, is_token_allowed
+from users.models import User
+from users.token_cache import verified_tokens
 
-from django.core.cache import cache
 from django.contrib.auth.models import AnonymousUser
-from django.utils.functional import SimpleLazyObject
 from rest_framework.authentication import BaseAuthentication
 
 
@@ -13,11 +13,18 @@ class JWTAuthentication(BaseAuthentication):
             return (AnonymousUser(), None)
 
         token = auth_header.split("Bearer ")[1]
-        if not cache.get(token):
-            return (AnonymousUser(), None)
+        user = verified_tokens.get(token)
+        if user is not None:
+            return (user, token)
 
+        generation = verified_tokens.generation
         payload = decode_token(token)
-        if not payload or payload.get("type") != "access":
+        if not payload or payload.get("type") != "access" or not is_token_allowed(token, payload):
+            return (AnonymousUser(), None)
+
+        user = User.objects.filter(id=payload.get("user_id")).first()
+        if user is None:
             return (AnonymousUser(), None)
 
-        return (SimpleLazyObject(lambda: get_user_from_token(token)), token)
+        verified_tokens.set(token, user, payload["exp"], generation)
+        return (user, token)
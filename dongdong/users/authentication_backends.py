@@ -1,6 +1,8 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
 
+from users.hashing import check_password
+
 User = get_user_model()
 
 
@@ -15,7 +17,7 @@ class PhoneNumberBackend(ModelBackend):
         
         try:
             user = User.objects.get(phone_number=phone_number)
-            if user.check_password(password):
+            if check_password(user, password):
                 return user
         except User.DoesNotExist:
             return None
@@ -0,0 +1,38 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    Fixed-size set of strings that answers "maybe present" or "definitely absent".
+
+    Sized for `capacity` items at a false positive rate of `error_rate`; past capacity the rate climbs, so
+    callers rebuild a bigger filter instead of adding more.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, item):
+        # Double hashing: k positions from the two halves of a single digest.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        if item in self:
+            return
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,89 @@
+"""
+Password hashing off the request thread.
+
+PBKDF2 runs for hundreds of milliseconds per call. A shared, bounded pool caps how many run at once per
+process, so a burst of logins cannot take every CPU from the cheap endpoints, and logins beyond what the pool
+can take (PASSWORD_HASHING_WORKERS running plus PASSWORD_HASHING_QUEUE waiting) are refused at once with a 503
+and Retry-After instead of queueing behind each other. hashlib releases the GIL while hashing, so threads run
+in parallel.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many logins at once, try again shortly."
+    default_code = "hashing_busy"
+
+    def __init__(self, detail=None, code=None):
+        super().__init__(detail, code)
+        # DRF sends `wait` back as the Retry-After header.
+        self.wait = settings.PASSWORD_HASHING_RETRY_AFTER
+
+
+class HashingPool:
+    def __init__(self, workers, queue_size, timeout):
+        self.workers = workers
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hashing")
+            return self.executor
+
+    def run(self, function, *args):
+        if not self.slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self.get_executor().submit(function, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise HashingBusy()
+
+
+hashing_pool = HashingPool(
+    workers=settings.PASSWORD_HASHING_WORKERS,
+    queue_size=settings.PASSWORD_HASHING_QUEUE,
+    timeout=settings.PASSWORD_HASHING_TIMEOUT,
+)
+
+
+def make_password(password):
+    return hashing_pool.run(hashers.make_password, password)
+
+
+def verify_password(password, encoded):
+    """Return (correct, must_update): whether `password` matches and whether `encoded` should be rehashed."""
+
+    def verify():
+        outdated = []
+        correct = hashers.check_password(password, encoded, setter=outdated.append)
+        return correct, bool(outdated)
+
+    return hashing_pool.run(verify)
+
+
+def check_password(user, password):
+    """User.check_password() with the hashing in the pool; a hash in an outdated format is upgraded here."""
+    correct, must_update = verify_password(password, user.password)
+    if must_update:
+        user.password = make_password(password)
+        user.save(update_fields=["password"])
+    return correct
@@ -1,72 +1,174 @@
 import random
+import re
 import string
+import time
+import uuid
 import jwt
 from datetime import datetime
 
 from django.conf import settings
 from django.core.cache import cache
+from django_redis import get_redis_connection
 
 from users.models import User
+from users.token_cache import publish_revocation, revoked_tokens
 
 
-def generate_random_username():
-    while True:
-        username = "user_" + "".join(random.choices(string.ascii_lowercase + string.digits, k=8))
-        if not User.objects.filter(username=username).exists():
-            return username
+def random_username():
+    return "user_" + "".join(random.choices(string.ascii_lowercase + string.digits, k=8))
 
 
-def create_access_and_refresh_token(user):
-    access = {
-        "user_id": user.id,
-        "type": "access",
-        "exp": datetime.utcnow() + settings.JWT_ACCESS_TOKEN_LIFETIME,
-    }
-    refresh = {
-        "user_id": user.id,
-        "type": "refresh",
-        "exp": datetime.utcnow() + settings.JWT_REFRESH_TOKEN_LIFETIME,
+def generate_random_username():
+    return generate_random_usernames(1)[0]
+
+
+def generate_random_usernames(count):
+    """`count` distinct unused usernames, checked against the table with one query per round of candidates."""
+    usernames = set()
+    while len(usernames) < count:
+        candidates = {random_username() for _ in range(count - len(usernames))} - usernames
+        taken = set(User.objects.filter(username__in=candidates).values_list("username", flat=True))
+        usernames |= candidates - taken
+    return list(usernames)
+
+
+def normalize_phone_number(phone_number):
+    """989XXXXXXXXX for +989..., 09... or 9... numbers; None when `phone_number` is none of those."""
+    if re.match(r"^(?:\+989|09|9)\d{9}$", phone_number):
+        return "989" + phone_number[-9:]
+    return None
+
+
+def synthetic_phone_numbers(count, seed):
+    """
+    `count` phone numbers 989PPPNNNNNN for synthetic users (benchmarks, load tests). The three digits PPP start
+    at `seed` % 1000 and move on past every prefix some existing user's number already has, so the numbers
+    collide neither with real users nor with the leftovers of an earlier run.
+    """
+    if count > 10**6:
+        raise ValueError("At most 1000000 synthetic phone numbers fit under one prefix.")
+    for step in range(1000):
+        prefix = f"989{(seed + step) % 1000:03d}"
+        if not User.objects.filter(phone_number__startswith=prefix).exists():
+            return [f"{prefix}{i:06d}" for i in range(count)]
+    raise RuntimeError("Every synthetic phone number prefix is taken.")
+
+
+def phone_miss_key(phone_number):
+    return f"phone-miss:{phone_number}"
+
+
+def lookup_users_by_phone(phone_numbers):
+    """
+    {phone number: User} for the normalized `phone_numbers` that belong to a user, in one IN query.
+
+    Numbers found to have no user are remembered for USERS_LOOKUP_MISS_TTL seconds and not queried again.
+    """
+    phone_numbers = set(phone_numbers)
+    misses = cache.get_many([phone_miss_key(phone_number) for phone_number in phone_numbers])
+    wanted = [phone_number for phone_number in phone_numbers if phone_miss_key(phone_number) not in misses]
+    if not wanted:
+        return {}
+
+    users = {user.phone_number: user for user in User.objects.filter(phone_number__in=wanted)}
+    cache.set_many(
+        {phone_miss_key(phone_number): True for phone_number in wanted if phone_number not in users},
+        timeout=settings.USERS_LOOKUP_MISS_TTL,
+    )
+    return users
+
+
+def forget_phone_misses(phone_numbers):
+    """Call once users with `phone_numbers` exist, so lookups find them before their misses expire."""
+    cache.delete_many([phone_miss_key(phone_number) for phone_number in phone_numbers])
+
+
+def allowlist_key(token, payload):
+    """
+    Cache key marking `token` as valid: jti:<jti> for current tokens.
+
+    Tokens issued before tokens carried a jti were stored under the whole JWT; they stay valid until they
+    expire unless JWT_ACCEPT_LEGACY_TOKENS is turned off.
+    """
+    jti = payload.get("jti")
+    if jti:
+        return f"jti:{jti}"
+    if settings.JWT_ACCEPT_LEGACY_TOKENS:
+        return token
+    return None
+
+
+def encode_token(user_id, token_type, lifetime):
+    """Return (token, jti); the jti is what the allowlist stores."""
+    jti = uuid.uuid4().hex
+    payload = {
+        "user_id": user_id,
+        "type": token_type,
+        "jti": jti,
+        "exp": datetime.utcnow() + lifetime,
     }
-    access_token = jwt.encode(access, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
-    refresh_token = jwt.encode(refresh, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+    return jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM), jti
 
-    cache.set(access_token, True, timeout=6000000)
-    cache.set(refresh_token, True, timeout=6000000)
 
-    return access_token, refresh_token
+def allow_tokens(entries):
+    """
+    Add (jti, lifetime) pairs to the allowlist, each expiring together with its token.
 
+    On Redis the writes go out in one pipeline, so a login costs one round trip; other caches get one set()
+    per token.
+    """
+    try:
+        redis = get_redis_connection("default")
+    except NotImplementedError:
+        for jti, lifetime in entries:
+            cache.set(f"jti:{jti}", 1, timeout=int(lifetime.total_seconds()))
+        return
 
-def create_access_token_from_refresh_token(access_token, refresh_token):
-    cache.delete(access_token)
-    payload = decode_token(refresh_token)
+    pipeline = redis.pipeline(transaction=False)
+    for jti, lifetime in entries:
+        # django-redis stores integers unserialized, so cache.get() reads these keys back as 1.
+        pipeline.set(cache.make_key(f"jti:{jti}"), 1, ex=int(lifetime.total_seconds()))
+    pipeline.execute()
 
-    if not payload or payload.get("type") != "refresh":
-        raise ValueError("this is not a refresh token!")
 
-    payload = decode_token(refresh_token)
-    if payload:
-        user_id = payload.get("user_id")
+def is_token_allowed(token, payload):
+    if settings.JWT_STATELESS and payload.get("jti"):
+        return not revoked_tokens.is_revoked(payload["jti"])
+    key = allowlist_key(token, payload)
+    return key is not None and bool(cache.get(key))
 
-    new_payload = {
-        "user_id": user_id,
-        "type": "access",
-        "exp": datetime.now() + settings.JWT_ACCESS_TOKEN_LIFETIME,
-    }
-    new_access_token = jwt.encode(new_payload, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
 
-    cache.set(new_access_token, True, timeout=6000000)
+def create_access_and_refresh_token(user):
+    access_token, access_jti = encode_token(user.id, "access", settings.JWT_ACCESS_TOKEN_LIFETIME)
+    refresh_token, refresh_jti = encode_token(user.id, "refresh", settings.JWT_REFRESH_TOKEN_LIFETIME)
+    allow_tokens([(access_jti, settings.JWT_ACCESS_TOKEN_LIFETIME), (refresh_jti, settings.JWT_REFRESH_TOKEN_LIFETIME)])
 
-    return new_access_token
+    return access_token, refresh_token
 
 
 def block_token(token):
-    if not cache.delete(token):
+    payload = decode_token(token, verify_exp=False)
+    key = allowlist_key(token, payload) if payload else None
+    if key is None:
+        raise ValueError("Token not found in cache or already blocked.")
+
+    expired = payload.get("exp", 0) <= time.time()
+    if not cache.delete(key) and not expired:
         raise ValueError("Token not found in cache or already blocked.")
+    if payload.get("jti"):
+        # Recorded in either mode, so switching to JWT_STATELESS does not bring logged-out tokens back.
+        revoked_tokens.revoke(payload["jti"], payload["exp"])
+    publish_revocation(token)
 
 
-def decode_token(token):
+def decode_token(token, verify_exp=True):
     try:
-        return jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+        return jwt.decode(
+            token,
+            settings.JWT_SECRET_KEY,
+            algorithms=[settings.JWT_ALGORITHM],
+            options={"verify_exp": verify_exp},
+        )
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
@@ -0,0 +1,80 @@
+import statistics
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from expenses.benchmarks import Rollback
+from users.authentication import JWTAuthentication
+from users.helpers import block_token, create_access_and_refresh_token, synthetic_phone_numbers
+from users.models import User
+from users.token_cache import verified_tokens
+
+# mode: (JWT_STATELESS, keep the worker's verified token cache between requests)
+AUTH_MODES = {
+    "allowlist": (False, False),
+    "stateless": (True, False),
+    "verified-cache": (False, True),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the per-request cost of JWTAuthentication against the configured cache: the allowlist lookup, "
+        "stateless verification with the revoked-jti bloom filter, and a hit in the worker's verified token "
+        "cache. Run it against Redis; with the local memory cache every lookup is free."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000, help="Authentications per run.")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--revoked", type=int, default=1000, help="Tokens to revoke before measuring.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                (phone_number,) = synthetic_phone_numbers(1, time.time_ns())
+                user = User.objects.create_user(
+                    username="benchmark_auth", phone_number=phone_number, email="benchmark_auth@example.com"
+                )
+                for _ in range(options["revoked"]):
+                    block_token(create_access_and_refresh_token(user)[0])
+                token = create_access_and_refresh_token(user)[0]
+                request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+
+                self.stdout.write(f"{'mode':<15} {'best us':>9} {'median us':>10} {'cache reads':>12} {'queries':>8}")
+                for mode, (stateless, keep_verified) in AUTH_MODES.items():
+                    with override_settings(JWT_STATELESS=stateless):
+                        timings, reads, queries = self.measure(request, keep_verified, options)
+                    self.stdout.write(
+                        f"{mode:<15} {min(timings):>9.1f} {statistics.median(timings):>10.1f} "
+                        f"{reads:>12.2f} {queries:>8.2f}"
+                    )
+                raise Rollback
+        except Rollback:
+            pass
+        verified_tokens.clear()
+
+    def measure(self, request, keep_verified, options):
+        """Microseconds per authentication for each run, and cache reads and queries per authentication."""
+        authentication = JWTAuthentication()
+        authentication.authenticate(request)
+        timings = []
+        for _ in range(options["repeat"]):
+            started = time.perf_counter()
+            for _ in range(options["requests"]):
+                if not keep_verified:
+                    verified_tokens.clear()
+                authentication.authenticate(request)
+            timings.append((time.perf_counter() - started) / options["requests"] * 1e6)
+
+        with mock.patch.object(cache, "get", wraps=cache.get) as reads, CaptureQueriesContext(connection) as queries:
+            for _ in range(options["requests"]):
+                if not keep_verified:
+                    verified_tokens.clear()
+                authentication.authenticate(request)
+        return timings, reads.call_count / options["requests"], len(queries) / options["requests"]
@@ -0,0 +1,65 @@
+import functools
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from jobs.worker import init_worker
+from users.provisioning import Provisioner, read_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users in bulk from a CSV file with phone_number,email,password columns. Passwords are hashed "
+        "in a pool of worker processes and users are inserted in batches; rows that are invalid or clash with "
+        "an existing user are skipped and reported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file to read, or - for stdin.")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Processes hashing passwords; 0 hashes in this process.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--max-errors", type=int, default=100, help="Skipped rows to list in the report.")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        try:
+            stream = sys.stdin if options["path"] == "-" else open(options["path"], newline="", encoding="utf-8")
+        except OSError as e:
+            raise CommandError(str(e))
+
+        with stream:
+            if options["workers"] == 0:
+                report = Provisioner(options["batch_size"], options["max_errors"]).run(read_users(stream))
+            else:
+                report = self.run_pool(stream, options)
+
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run_pool(self, stream, options):
+        workers = options["workers"]
+        # Spawned, as in run_jobs, so no worker inherits this process's database connection.
+        connections.close_all()
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(os.environ["DJANGO_SETTINGS_MODULE"],),
+        )
+        with pool:
+            # A few chunks per worker keeps them all busy without pickling one password at a time.
+            chunksize = max(1, options["batch_size"] // (4 * workers))
+            provisioner = Provisioner(
+                options["batch_size"], options["max_errors"], hash_map=functools.partial(pool.map, chunksize=chunksize)
+            )
+            return provisioner.run(read_users(stream))
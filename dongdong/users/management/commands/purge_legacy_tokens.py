@@ -0,0 +1,16 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the allowlist entries stored under whole JWTs before tokens were allowlisted by jti. Every token "
+        "issued before then is logged out; run it once JWT_ACCEPT_LEGACY_TOKENS is off."
+    )
+
+    def handle(self, *args, **options):
+        if not hasattr(cache, "delete_pattern"):
+            raise CommandError("The default cache cannot delete keys by pattern; this needs django-redis.")
+        # Every HS256 JWT starts with the base64 of '{"alg"' / '{"typ"', i.e. "eyJ".
+        deleted = cache.delete_pattern("eyJ*", itersize=1000)
+        self.stdout.write(f"Deleted {deleted} legacy token keys.")
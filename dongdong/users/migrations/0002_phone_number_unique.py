@@ -0,0 +1,40 @@
+# Generated by Django 4.2 on 2026-10-18 04:35
+
+from django.db import migrations, models
+from django.db.models import Count
+import users.models
+
+
+def check_duplicate_phone_numbers(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    duplicates = list(
+        User.objects.values("phone_number")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .values_list("phone_number", flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Cannot make users.phone_number unique; these numbers belong to more than one user: "
+            + ", ".join(duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_phone_numbers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="user",
+            name="phone_number",
+            field=models.CharField(
+                max_length=13,
+                unique=True,
+                validators=[users.models.validate_phone_number],
+            ),
+        ),
+    ]
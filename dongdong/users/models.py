@@ -13,5 +13,7 @@ def validate_phone_number(phone_number):
 
 
 class User(AbstractUser):
-    phone_number = models.CharField(max_length=13, blank=False, null=False, validators=[validate_phone_number])
+    phone_number = models.CharField(
+        max_length=13, unique=True, blank=False, null=False, validators=[validate_phone_number]
+    )
     email = models.EmailField(_("email address"), unique=True, blank=True, null=True)
@@ -0,0 +1,128 @@
+import csv
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db.models import Q
+
+from users.helpers import forget_phone_misses, generate_random_usernames, normalize_phone_number
+from users.models import User
+
+CSV_COLUMNS = ["phone_number", "email", "password"]
+
+
+def read_users(lines):
+    """Yield (line_number, row) from CSV rows with CSV_COLUMNS as header; email and password may be empty."""
+    rows = csv.DictReader(lines)
+    for row in rows:
+        yield rows.line_num, row
+
+
+def clean_user(row):
+    """Return (user fields, None) for a valid row, or (None, errors)."""
+    errors = {}
+    phone_number = normalize_phone_number((row.get("phone_number") or "").strip())
+    if phone_number is None:
+        errors["phone_number"] = ["Phone number must start with +989, 09 or 9 followed by 9 digits."]
+
+    email = (row.get("email") or "").strip() or None
+    if email is not None:
+        try:
+            validate_email(email)
+        except ValidationError as e:
+            errors["email"] = e.messages
+        email = User.objects.normalize_email(email)
+
+    if errors:
+        return None, errors
+    # Users without a password get an unusable one, like createsuperuser --noinput.
+    return {"phone_number": phone_number, "email": email, "password": row.get("password") or None}, None
+
+
+class Provisioner:
+    """
+    Creates users in batches: one query finds phone numbers and emails already taken, one (occasionally
+    more) picks unused usernames, the passwords are hashed by `hash_map` and the batch goes in with a single
+    bulk_create.
+
+    `hash_map` is a map()-like callable; pass a process pool's map to hash on several cores.
+    """
+
+    def __init__(self, batch_size, max_errors, hash_map=map):
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.hash_map = hash_map
+        self.seen_phone_numbers = set()
+        self.seen_emails = set()
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def fail(self, line_number, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line_number, "errors": errors})
+
+    def run(self, rows):
+        started = time.perf_counter()
+        batch = []
+        for line_number, row in rows:
+            fields, errors = clean_user(row)
+            if errors:
+                self.fail(line_number, errors)
+                continue
+            batch.append((line_number, fields))
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+
+        seconds = time.perf_counter() - started
+        return {
+            "created": self.created,
+            "failed": self.failed,
+            "errors": self.errors,
+            "seconds": round(seconds, 3),
+            "users_per_second": round(self.created / seconds, 1) if seconds else None,
+        }
+
+    def write(self, batch):
+        phone_numbers = {fields["phone_number"] for _, fields in batch}
+        emails = {fields["email"] for _, fields in batch if fields["email"]}
+        taken = User.objects.filter(Q(phone_number__in=phone_numbers) | Q(email__in=emails)).values_list(
+            "phone_number", "email"
+        )
+        for phone_number, email in taken:
+            self.seen_phone_numbers.add(phone_number)
+            self.seen_emails.add(email)
+
+        accepted = []
+        for line_number, fields in batch:
+            if fields["phone_number"] in self.seen_phone_numbers:
+                self.fail(line_number, {"phone_number": ["A user with this phone number already exists."]})
+            elif fields["email"] and fields["email"] in self.seen_emails:
+                self.fail(line_number, {"email": ["user with this email address already exists."]})
+            else:
+                self.seen_phone_numbers.add(fields["phone_number"])
+                if fields["email"]:
+                    self.seen_emails.add(fields["email"])
+                accepted.append(fields)
+        if not accepted:
+            return
+
+        passwords = self.hash_map(make_password, [fields["password"] for fields in accepted])
+        usernames = generate_random_usernames(len(accepted))
+        users = [
+            User(
+                username=username,
+                phone_number=fields["phone_number"],
+                email=fields["email"],
+                password=password,
+            )
+            for fields, username, password in zip(accepted, usernames, passwords)
+        ]
+        User.objects.bulk_create(users)
+        forget_phone_misses([user.phone_number for user in users])
+        self.created += len(users)
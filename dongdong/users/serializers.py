@@ -1,10 +1,12 @@
-import re
-
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import authenticate
 
 from users.models import User
-from users.helpers import generate_random_username
+from users.hashing import make_password
+from users.helpers import forget_phone_misses, generate_random_username, normalize_phone_number
+
+PHONE_NUMBER_ERROR = "Phone number must be start with +989 or 09 or 9 and And its length must be 9."
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -16,24 +18,28 @@ class RegisterSerializer(serializers.ModelSerializer):
         extra_kwargs = {"email": {"required": False}, "password": {"write_only": True}}
 
     def validate_phone_number(self, phone_number):
-        pattern = r"^(?:\+989|09|9)\d{9}$"
-        if re.match(pattern, phone_number):
-            return "989" + phone_number[-9:]
-        raise serializers.ValidationError(
-            "Phone number must be start with +989 or 09 or 9 and And its length must be 9."
-        )
+        phone_number = normalize_phone_number(phone_number)
+        if phone_number is None:
+            raise serializers.ValidationError(PHONE_NUMBER_ERROR)
+        if User.objects.filter(phone_number=phone_number).exists():
+            raise serializers.ValidationError("A user with this phone number already exists.")
+        return phone_number
 
     def create(self, validated_data):
         email = validated_data.get("email")
         if not email:
             email = None
-        
-        user = User.objects.create_user(
+
+        # Hashed before anything is written, so a busy hashing pool leaves no half-registered user behind.
+        password = make_password(validated_data["password"])
+        user = User(
             username=generate_random_username(),
-            email=email,
+            email=User.objects.normalize_email(email) if email else None,
             phone_number=validated_data["phone_number"],
-            password=validated_data["password"],
+            password=password,
         )
+        user.save()
+        forget_phone_misses([user.phone_number])
         return user
 
 
@@ -42,12 +48,10 @@ class LoginSerializer(serializers.Serializer):
     password = serializers.CharField(write_only=True)
 
     def validate_phone_number(self, phone_number):
-        pattern = r"^(?:\+989|09|9)\d{9}$"
-        if re.match(pattern, phone_number):
-            return "989" + phone_number[-9:]
-        raise serializers.ValidationError(
-            "Phone number must be start with +989 or 09 or 9 and And its length must be 9."
-        )
+        phone_number = normalize_phone_number(phone_number)
+        if phone_number is None:
+            raise serializers.ValidationError(PHONE_NUMBER_ERROR)
+        return phone_number
 
     def validate(self, data):
         user = authenticate(phone_number=data.get("phone_number"), password=data.get("password"))
@@ -65,3 +69,15 @@ class LogoutSerializer(serializers.Serializer):
 class RefreshTokenSerializer(serializers.Serializer):
     refresh = serializers.CharField(required=True)
     access = serializers.CharField(required=True)
+
+
+class PhoneLookupSerializer(serializers.Serializer):
+    phone_numbers = serializers.ListField(
+        child=serializers.CharField(), allow_empty=False, max_length=settings.USERS_LOOKUP_MAX_NUMBERS
+    )
+
+
+class UserSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ("id", "phone_number", "email", "username")
@@ -1,3 +1,162 @@
-from django.test import TestCase
+import io
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from rest_framework.test import APIClient
+
+from users import helpers
+from users.helpers import block_token, create_access_and_refresh_token, generate_random_usernames
+from users.models import User
+from users.provisioning import Provisioner, read_users
+from users.token_cache import verified_tokens
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class ProvisionUsersTests(TestCase):
+    def provision(self, csv, batch_size=100):
+        return Provisioner(batch_size, max_errors=10).run(read_users(io.StringIO(csv)))
+
+    def test_usernames_are_distinct_and_unused(self):
+        User.objects.create(username="taken", phone_number="989100000000")
+        with CaptureQueriesContext(connection) as queries:
+            usernames = generate_random_usernames(500)
+        self.assertEqual(len(set(usernames)), 500)
+        self.assertNotIn("taken", usernames)
+        self.assertEqual(len(queries), 1)
+
+    def test_batches_skip_invalid_and_taken_rows(self):
+        User.objects.create(username="existing", phone_number="989100000000", email="old@example.com")
+        rows = "".join(f"0912{i:07d},user{i}@Example.com,pw{i}\n" for i in range(250))
+        report = self.provision(
+            "phone_number,email,password\n"
+            + rows
+            + "12345,,x\n"
+            + "09100000000,,x\n"
+            + "+989120000001,,x\n"
+            + "09130000000,old@EXAMPLE.com,x\n"
+            + "09130000001,,\n"
+        )
+
+        self.assertEqual(report["created"], 251)
+        self.assertEqual([error["line"] for error in report["errors"]], [252, 253, 254, 255])
+        user = User.objects.get(phone_number="989120000007")
+        self.assertEqual(user.email, "user7@example.com")
+        self.assertTrue(user.check_password("pw7"))
+        self.assertFalse(User.objects.get(phone_number="989130000001").has_usable_password())
+
+    def test_queries_per_batch_do_not_grow_with_batch_size(self):
+        csv = "phone_number,email,password\n" + "".join(f"0912{i:07d},,pw\n" for i in range(300))
+        with CaptureQueriesContext(connection) as queries:
+            self.provision(csv, batch_size=300)
+        # One lookup of taken phone numbers and emails and one of taken usernames; the rest is bulk INSERTs.
+        selects = [query for query in queries.captured_queries if query["sql"].startswith("SELECT")]
+        self.assertEqual(len(selects), 2)
+        self.assertEqual(User.objects.count(), 300)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"], THROTTLE_ENABLED=False)
+class RegisterTests(TestCase):
+    def test_users_may_register_without_an_email(self):
+        for phone_number in ("09100000001", "09100000002"):
+            response = APIClient().post("/users/register/", {"phone_number": phone_number, "password": "pw"})
+            self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(User.objects.filter(email__isnull=True).count(), 2)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"], THROTTLE_ENABLED=False)
+class PhoneLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="me", phone_number="989100000000", email="me@example.com")
+        self.friend = User.objects.create(username="friend", phone_number="989100000001")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def lookup(self, phone_numbers):
+        response = self.client.post("/users/lookup/", {"phone_numbers": phone_numbers}, format="json")
+        self.assertEqual(response.status_code, 200)
+        return [(row["normalized"], row["user"]["id"] if row["user"] else None) for row in response.data]
+
+    def test_numbers_are_normalized_and_matched_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = self.lookup(["09100000001", "+989100000000", "9100000002", "0910"])
+        self.assertEqual(
+            results,
+            [("989100000001", self.friend.id), ("989100000000", self.user.id), ("989100000002", None), (None, None)],
+        )
+        self.assertEqual(len(queries), 1)
+
+    def test_misses_are_cached_until_the_number_registers(self):
+        self.lookup(["09100000002"])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.lookup(["09100000002"]), [("989100000002", None)])
+        self.assertEqual(len(queries), 0)
+
+        response = APIClient().post(
+            "/users/register/", {"phone_number": "09100000002", "password": "pw"}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNotNone(self.lookup(["09100000002"])[0][1])
+
+        response = APIClient().post("/users/register/", {"phone_number": "9100000002", "password": "pw"}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(THROTTLE_ENABLED=False)
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        verified_tokens.clear()
+        self.user = User.objects.create(username="me", phone_number="989100000000")
+        self.access, self.refresh = create_access_and_refresh_token(self.user)
+
+    def search(self, access):
+        return APIClient().get("/users/search/?phone_number=09100000000", HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def logout(self):
+        response = APIClient().post("/users/logout/", {"access": self.access, "refresh": self.refresh})
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_logged_out_tokens_are_rejected(self):
+        self.assertEqual(self.search(self.access).status_code, 200)
+        self.logout()
+        self.assertEqual(self.search(self.access).status_code, 403)
+
+    @override_settings(JWT_STATELESS=True)
+    def test_logged_out_tokens_are_rejected_without_the_allowlist(self):
+        self.assertEqual(self.search(self.access).status_code, 200)
+        self.logout()
+        self.assertEqual(self.search(self.access).status_code, 403)
+
+    def test_a_token_revoked_while_it_is_verified_is_not_cached(self):
+        is_token_allowed = helpers.is_token_allowed
+
+        def revoked_right_after_the_check(token, payload):
+            allowed = is_token_allowed(token, payload)
+            block_token(token)
+            return allowed
+
+        with mock.patch("users.authentication.is_token_allowed", revoked_right_after_the_check):
+            self.assertEqual(self.search(self.access).status_code, 200)
+        self.assertIsNone(verified_tokens.get(self.access))
+        self.assertEqual(self.search(self.access).status_code, 403)
+
+    def refresh_tokens(self, access, refresh):
+        return APIClient().post("/users/refresh-token/", {"access": access, "refresh": refresh})
+
+    def test_a_refresh_token_is_good_for_one_refresh(self):
+        response = self.refresh_tokens(self.access, self.refresh)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.search(self.access).status_code, 403)
+        self.assertEqual(self.search(response.data["access"]).status_code, 200)
+
+        self.assertEqual(self.refresh_tokens(response.data["access"], self.refresh).status_code, 401)
+        self.assertEqual(self.search(response.data["access"]).status_code, 200)
+
+    def test_logged_out_refresh_tokens_are_refused(self):
+        self.logout()
+        self.assertEqual(self.refresh_tokens(self.access, self.refresh).status_code, 401)
+        self.assertEqual(self.refresh_tokens(self.refresh, self.access).status_code, 401)
@@ -0,0 +1,213 @@
+import copy
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from users.bloom import BloomFilter
+
+REVOCATION_SEQUENCE_KEY = "auth:revoked:seq"
+REVOKED_JTIS_KEY = "auth:revoked:jtis"
+# Revocations written by another worker can land slightly behind the newest one we have seen.
+REVOKED_JTIS_OVERLAP = 60
+
+
+def revocation_key(sequence):
+    return f"auth:revoked:{sequence}"
+
+
+def revoked_jti_key(jti):
+    return f"revoked:{jti}"
+
+
+def publish_revocation(token):
+    """
+    Tell every worker to drop `token` from its VerifiedTokenCache.
+
+    Revocations are numbered with an atomic counter and kept under auth:revoked:<n>; workers read the counter
+    every JWT_REVOCATION_SYNC_INTERVAL seconds and fetch the entries they have not seen yet.
+    """
+    cache.add(REVOCATION_SEQUENCE_KEY, 0, timeout=None)
+    sequence = cache.incr(REVOCATION_SEQUENCE_KEY)
+    cache.set(revocation_key(sequence), token, timeout=settings.JWT_REVOCATION_TTL)
+    verified_tokens.discard(token)
+
+
+class VerifiedTokenCache:
+    """
+    Per-process LRU of access token -> user, so hot requests skip Redis, jwt.decode and the user query.
+
+    An entry lives until the token expires or for JWT_USER_CACHE_TTL seconds, whichever comes first. The TTL
+    bounds how stale the cached user can be.
+
+    `generation` counts the revocations applied here. A token is verified before it is set(); read the
+    generation before verifying and pass it to set(), which drops the entry if a revocation was applied in
+    between, since that revocation may have been for this very token.
+    """
+
+    def __init__(self, max_size, ttl, sync_interval):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.last_sequence = None
+        self.next_sync = 0.0
+        self.generation = 0
+
+    def get(self, token):
+        self.sync()
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if now >= expires_at:
+                del self.entries[token]
+                return None
+            self.entries.move_to_end(token)
+        # Each request gets its own copy, so attributes cached on it do not leak into other requests.
+        return copy.copy(user)
+
+    def set(self, token, user, exp, generation):
+        expires_at = min(exp, time.time() + self.ttl)
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[token] = (user, expires_at)
+            self.entries.move_to_end(token)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def discard(self, token):
+        with self.lock:
+            self.entries.pop(token, None)
+            self.generation += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def sync(self):
+        """Apply the revocations published since the last sync, at most once per sync interval."""
+        now = time.monotonic()
+        if now < self.next_sync:
+            return
+        self.next_sync = now + self.sync_interval
+
+        sequence = cache.get(REVOCATION_SEQUENCE_KEY, 0)
+        if self.last_sequence is None or sequence < self.last_sequence:
+            # First sync, or the counter was reset (e.g. Redis flushed): nothing cached can be trusted.
+            self.clear()
+        elif sequence - self.last_sequence > self.max_size:
+            # Cheaper to start over than to fetch more revocations than we can hold tokens.
+            self.clear()
+        elif sequence > self.last_sequence:
+            keys = [revocation_key(n) for n in range(self.last_sequence + 1, sequence + 1)]
+            revoked = cache.get_many(keys)
+            if len(revoked) < len(keys):
+                # Some entries already expired, so we cannot tell which tokens they revoked.
+                self.clear()
+            else:
+                for token in revoked.values():
+                    self.discard(token)
+        self.last_sequence = sequence
+
+
+class RevokedTokenFilter:
+    """
+    Per-process bloom filter of revoked jtis, for stateless authentication (JWT_STATELESS).
+
+    The cache holds revoked:<jti> for the rest of each revoked token's lifetime; that is the answer, and the
+    filter only decides when it needs asking. Revocations are also added to a Redis sorted set scored by
+    revocation time, which workers read incrementally every JWT_REVOCATION_SYNC_INTERVAL seconds. Without a
+    Redis connection there is nothing to sync from and every check goes to the cache.
+    """
+
+    def __init__(self, capacity, error_rate, sync_interval, max_age):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.max_age = max_age
+        self.filter = None
+        self.synced_until = None
+        self.lock = threading.Lock()
+        self.next_sync = 0.0
+
+    def is_revoked(self, jti):
+        self.sync()
+        bloom = self.filter
+        if bloom is not None and jti not in bloom:
+            return False
+        return bool(cache.get(revoked_jti_key(jti)))
+
+    def revoke(self, jti, expires_at):
+        now = time.time()
+        if expires_at <= now:
+            return
+        cache.set(revoked_jti_key(jti), 1, timeout=math.ceil(expires_at - now))
+        try:
+            redis = get_redis_connection("default")
+        except NotImplementedError:
+            pass
+        else:
+            key = cache.make_key(REVOKED_JTIS_KEY)
+            pipeline = redis.pipeline(transaction=False)
+            pipeline.zadd(key, {jti: now})
+            # Anything revoked more than max_age ago has expired by now.
+            pipeline.zremrangebyscore(key, "-inf", now - self.max_age)
+            pipeline.execute()
+
+        with self.lock:
+            if self.filter is not None:
+                self.filter.add(jti)
+
+    def sync(self):
+        """Add the jtis revoked since the last sync, at most once per sync interval."""
+        now = time.monotonic()
+        if now < self.next_sync:
+            return
+        self.next_sync = now + self.sync_interval
+
+        try:
+            redis = get_redis_connection("default")
+        except NotImplementedError:
+            return
+        key = cache.make_key(REVOKED_JTIS_KEY)
+
+        bloom = self.filter
+        if bloom is None or len(bloom) >= bloom.capacity:
+            # First sync, or the filter is full and its false positive rate climbing: rebuild from the whole set.
+            entries = redis.zrangebyscore(key, "-inf", "+inf", withscores=True)
+            bloom = BloomFilter(max(self.capacity, 2 * len(entries)), self.error_rate)
+            synced_until = 0.0
+        else:
+            entries = redis.zrangebyscore(key, self.synced_until - REVOKED_JTIS_OVERLAP, "+inf", withscores=True)
+            synced_until = self.synced_until
+
+        with self.lock:
+            for jti, revoked_at in entries:
+                bloom.add(jti.decode())
+                synced_until = max(synced_until, revoked_at)
+            self.filter = bloom
+            self.synced_until = synced_until
+
+
+verified_tokens = VerifiedTokenCache(
+    max_size=settings.JWT_USER_CACHE_SIZE,
+    ttl=settings.JWT_USER_CACHE_TTL,
+    sync_interval=settings.JWT_REVOCATION_SYNC_INTERVAL,
+)
+
+revoked_tokens = RevokedTokenFilter(
+    capacity=settings.JWT_REVOKED_FILTER_CAPACITY,
+    error_rate=settings.JWT_REVOKED_FILTER_ERROR_RATE,
+    sync_interval=settings.JWT_REVOCATION_SYNC_INTERVAL,
+    max_age=settings.JWT_REFRESH_TOKEN_LIFETIME.total_seconds(),
+)
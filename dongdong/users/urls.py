@@ -1,5 +1,5 @@
 from django.urls import path
-from users.views import RegisterView, LoginView, RefreshTokenView, LogoutView, UserSearchView
+from users.views import RegisterView, LoginView, RefreshTokenView, LogoutView, UserSearchView, PhoneLookupView
 
 urlpatterns = [
     path("register/", RegisterView.as_view(), name="user-register"),
@@ -7,4 +7,5 @@ urlpatterns = [
     path("logout/", LogoutView.as_view(), name="user-logout"),
     path("refresh-token/", RefreshTokenView.as_view(), name="refresh-token"),
     path("search/", UserSearchView.as_view(), name="user-search"),
+    path("lookup/", PhoneLookupView.as_view(), name="user-lookup"),
 ]
@@ -7,17 +7,24 @@ from users.serializers import (
     RegisterSerializer,
     LoginSerializer,
     LogoutSerializer,
+    PhoneLookupSerializer,
     RefreshTokenSerializer,
+    UserSummarySerializer,
 )
 from users.models import User
 from users.helpers import (
     create_access_and_refresh_token,
     block_token,
-    get_user_from_token,
+    decode_token,
+    is_token_allowed,
+    lookup_users_by_phone,
+    normalize_phone_number,
 )
 
 
 class RegisterView(APIView):
+    throttle_cost = 10
+
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
@@ -41,6 +48,8 @@ class RegisterView(APIView):
 
 
 class LoginView(APIView):
+    throttle_cost = 10
+
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
         if serializer.is_valid():
@@ -75,24 +84,48 @@ class LogoutView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def invalid_refresh_token():
+    return Response({"detail": "Invalid or revoked refresh token."}, status=status.HTTP_401_UNAUTHORIZED)
+
+
 class RefreshTokenView(APIView):
     def post(self, request):
         serializer = RefreshTokenSerializer(data=request.data)
         if serializer.is_valid():
             access_token = serializer.validated_data["access"]
             refresh_token = serializer.validated_data["refresh"]
-            if get_user_from_token(refresh_token) == get_user_from_token(access_token):
-                user = get_user_from_token(refresh_token)
-                new_access_token, new_refresh_token = create_access_and_refresh_token(user)
+            # The access token being refreshed has usually just expired.
+            access_payload = decode_token(access_token, verify_exp=False)
+            refresh_payload = decode_token(refresh_token)
+            if (
+                not access_payload
+                or not refresh_payload
+                or refresh_payload.get("type") != "refresh"
+                or access_payload.get("user_id") != refresh_payload.get("user_id")
+                or not is_token_allowed(refresh_token, refresh_payload)
+            ):
+                return invalid_refresh_token()
+            user = User.objects.filter(id=refresh_payload["user_id"]).first()
+            if user is None:
+                return invalid_refresh_token()
+            try:
+                # Revoked before minting, so requests racing with the same refresh token get one new pair.
                 block_token(refresh_token)
+            except ValueError:
+                return invalid_refresh_token()
+            try:
                 block_token(access_token)
-                return Response(
-                    {
-                        "access": new_access_token,
-                        "refresh": new_refresh_token,
-                    },
-                    status=status.HTTP_200_OK,
-                )
+            except ValueError:
+                # Already logged out or expired; nothing left to revoke.
+                pass
+            new_access_token, new_refresh_token = create_access_and_refresh_token(user)
+            return Response(
+                {
+                    "access": new_access_token,
+                    "refresh": new_refresh_token,
+                },
+                status=status.HTTP_200_OK,
+            )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -108,7 +141,7 @@ class UserSearchView(APIView):
             )
         
         try:
-            user = User.objects.get(phone_number=phone_number)
+            user = User.objects.get(phone_number=normalize_phone_number(phone_number) or phone_number)
             return Response({
                 "id": user.id,
                 "phone_number": user.phone_number,
@@ -120,3 +153,34 @@ class UserSearchView(APIView):
                 {"detail": "User not found"}, 
                 status=status.HTTP_404_NOT_FOUND
             )
+
+
+class PhoneLookupView(APIView):
+    """
+    Match a batch of contacts' phone numbers to users.
+
+    Answers in request order with the normalized number and the user, either of which is null when the
+    number is not valid or has no user.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    query_budget = 2
+    throttle_cost = 5
+
+    def post(self, request):
+        serializer = PhoneLookupSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        phone_numbers = serializer.validated_data["phone_numbers"]
+        normalized = [normalize_phone_number(phone_number) for phone_number in phone_numbers]
+        users = lookup_users_by_phone(phone_number for phone_number in normalized if phone_number)
+        return Response(
+            [
+                {
+                    "phone_number": phone_number,
+                    "normalized": normal,
+                    "user": UserSummarySerializer(users[normal]).data if normal in users else None,
+                }
+                for phone_number, normal in zip(phone_numbers, normalized)
+            ]
+        )